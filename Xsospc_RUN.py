@@ -2,7 +2,6 @@
 from agent_core import AgentCore
 from autonomous_loop import AutonomousLoop
 from prompt_engine import Personailty
-from example import main
 import sys
 from response_engine import PromptEngine
 from opinion_system import OpinionSystem
@@ -14,7 +13,7 @@ from emotion_expression import FacialExpression
 class Codex:
     """Main orchestrator - the 'brain' of Codex"""
 
-    def __init__(self, user_id):
+    def __init__(self, user_id, check_health: bool = True):
         # ONE core
         self.core = AgentCore()
         
@@ -25,8 +24,9 @@ class Codex:
         self.memory = selfaware(self.core, user_id)
         self.opinions = OpinionSystem(self.core)
         self.autonomous = AutonomousLoop(user_id,self.core)
-        self.engine = PromptEngine(self.core, self.personality, self.memory, session_id=user_id)
-        self.memorySearch = MemorySearch(user_memory=self.memory.get_current_user_info())
+        self.engine = PromptEngine(self.core, self.personality, self.memory, session_id=user_id,
+                                   check_health=check_health)
+        self.memorySearch = MemorySearch(user_memory=self.memory)
     
     def start(self):
         """Boot everything"""
@@ -36,7 +36,13 @@ class Codex:
     
     def chat(self, message: str):
         """Main interaction"""
+        self.autonomous.notify_activity()
         return self.engine.chat(message)
+
+    def stream_chat(self, message: str):
+        """Main interaction, the reply arrives piece by piece"""
+        self.autonomous.notify_activity()
+        return self.engine.stream_chat(message)
     
     def get_selfaware(self):
         """Achieve User Memory data"""
@@ -63,10 +69,16 @@ class Codex:
         return self.expression
 
 
+def training_demo():
+    """The PyTorch demo in example.py, torch/numpy/matplotlib load only here"""
+    from example import main
+    main()
 
 
 if __name__ == "__main__":
-    
+    if "--train-demo" in sys.argv[1:]:
+        training_demo()
+        sys.exit(0)
     
     print("=" * 60)
     print("      CODEX")
@@ -106,7 +118,13 @@ if __name__ == "__main__":
     while True:
         user = input(f"{username}:  ")
         aware._learn_about_the_person(response=user)
-        response = engine.chat(response=user)
+        print("CODEX: ", end="", flush=True)
+        pieces = []
+        for piece in codex.stream_chat(user):
+            pieces.append(piece)
+            print(piece, end="", flush=True)
+        print()
+        response = "".join(pieces)
         create_face = face.check_emotion(response)
         faceial_expression = face.get_emotion()
         import logging
@@ -126,7 +144,6 @@ if __name__ == "__main__":
         logger.debug(f"Context: {response}")
         #logger.error(f"JSON creation failed: {e}")
         logger.info(f"User message: {user}\n\n\n\n")
-        print(f"CODEX: {response}")
 
 
 
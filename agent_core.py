@@ -2,18 +2,58 @@
 
 
 from pathlib import Path
+import functools
 import os
 import re
 import random
+import threading
+from types import MappingProxyType
 from typing import Dict, List, Optional
 from datetime import datetime, date
 import json
 import uuid
+from write_behind import WriteBehindStore
+from journal import atomic_write_json
+from emotional_state import EmotionalState
+from emotion_scorer import FEAR, HATE, LOVE, PLEASE, WEIGHTS, get_scorer
 
 
+def _writes(method):
+    """Run a state-changing method under the core lock, then publish a new snapshot"""
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        with self._lock:
+            result = method(self, *args, **kwargs)
+            self._publish()
+            return result
+    return locked
+
+
+def _neutral_cycle() -> int:
+    """Plain words it takes set_mood to fade neutral (0.3) below 0.1 and back to neutral"""
+    intensity, words = 0.3, 0
+    while intensity >= 0.1:
+        intensity *= 0.9
+        words += 1
+    return words
+
+
+_NEUTRAL_CYCLE = _neutral_cycle()
 
 
 class AgentCore:
+    """
+    Codex's own state, shared by the chat path, the AutonomousLoop thread
+    and every user session.
+
+    Every method that changes state runs under one re-entrant lock
+    (see _writes), which the write-behind store also holds while it
+    dumps and writes the brain files, so a file never sees a half-made
+    change and two writes never interleave. Readers don't take the
+    lock: they read `snapshot()`, an immutable view republished after
+    every change.
+    """
+
     def __init__(self, storage_path: str = "codex/brain"):
         self.id = str(uuid.uuid4())
         self.father = self.mother = "Julius Cylien"
@@ -33,16 +73,20 @@ class AgentCore:
         self.confidence_level = 0.5
         self.curiosity_level = 0.8
         self.age = 0 # hours/minutes for now
-        self.emotion = {
-            "state": "average day",
-            "intensity": 0.32
-            }
+        self.emotion = EmotionalState("average day", 0.32)
         self.skills = {}
         self.memory = self._default_memory()
+        self.scorer = get_scorer()
+
+        self._lock = threading.RLock()
+        self._snapshot = None
+        self._publish()
 
         self.storage_path = Path(storage_path)
+        self.store = WriteBehindStore(lock=self._lock)
+        self.store.register("memory", self.storage_path / f"{self.name}_memory.json", lambda: self.memory)
+        self.store.register("data", self.storage_path / f"{self.name}_data.json", lambda: self.data)
         self.boot()
-        self.data = self._get_data_()
 
     def _default_memory(self):
         return {
@@ -55,6 +99,23 @@ class AgentCore:
             "favorite_animal": None     
             }
     
+    def _publish(self):
+        # a new object each time, never mutated, so readers need no lock
+        self._snapshot = MappingProxyType({
+            "emotion": MappingProxyType(self.emotion.to_dict()),
+            "mood_level": self.mood_level,
+            "connection_level": self.connection_level,
+            "trust_level": self.trust_level,
+            "confidence_level": self.confidence_level,
+            "curiosity_level": self.curiosity_level,
+            "age": self.age
+        })
+
+    def snapshot(self) -> MappingProxyType:
+        """Consistent read-only view of the levels, emotion and age"""
+        return self._snapshot
+
+    @_writes
     def boot(self):
         self.storage_path.mkdir(parents=True, exist_ok=True)
         self._load_or_create_brain()
@@ -62,6 +123,7 @@ class AgentCore:
 
 
 
+    @_writes
     def _adjust_confidence(self,success: bool):
         """Learn from interactions"""
         if success:
@@ -85,63 +147,46 @@ class AgentCore:
         brain_file = self.storage_path / f"{self.name}_memory.json"
         
 
-        if brain_file.exists():
-                with open(Path(brain_file), 'r') as f:
-                    self.memory = json.load(f)
+        if self.store.exists("memory"):
+            # snapshot + journal replay, survives a crash mid-write
+            self.memory = self.store.load("memory", default=self._default_memory())
 
         else:
             self.create_brain(brain_file)
         
 
     def _push_json(self, type: str):
+        """Mark the brain file dirty, the write-behind store saves it later"""
+        self.store.mark_dirty(type)
 
-        push = None
-
-        brain_file = self.storage_path / f"{self.name}_{type}.json"
-        if type == "memory":
-            push = self.memory
-        if type == "data":
-            push = self.data
-
-        try:
-            with open(brain_file, 'w') as f:
-                json.dump(push, f, indent=2)
-
-        except Exception as e:
-            print(f"ERROR when updating file: {e}")
+    def flush(self):
+        """Write every pending brain change to disk now"""
+        self.store.flush()  # takes self._lock
 
 
 
     def create_brain(self, file):
         file_path = Path(file)
-        try:
-            with open(file_path, 'w') as f:
-                json.dump(self.memory, f, indent=2)
-
-        except Exception as e:
-            print(f"[create_brain] PROBLEM WHEN CREATING JSON FILE: {e}")
+        if not atomic_write_json(file_path, self.memory):
+            print(f"[create_brain] PROBLEM WHEN CREATING JSON FILE: {file_path}")
 
 
 
     def _build_data(self):
         brain_file = self.storage_path / f"{self.name}_data.json"
 
-        if brain_file.exists():
-                with open(Path(brain_file), 'r') as f:
-                    self.data = json.load(f)
+        if self.store.exists("data"):
+            # `data` is generated from the fields, loading only lets the
+            # next save append a delta instead of a whole snapshot
+            self.store.load("data", default={})
 
         else:
             self.create_data_file(brain_file)
     
     def create_data_file(self, file):
         file_path = Path(file)
-        
-        try:
-            with open(file_path, 'w') as f:
-                json.dump(self.data, f, indent=2)
-
-        except Exception as e:
-            print(f"[create_data_file] PROBLEM WHEN CREATING JSON FILE: {e}")
+        if not atomic_write_json(file_path, self._get_data_()):
+            print(f"[create_data_file] PROBLEM WHEN CREATING JSON FILE: {file_path}")
 
     
 
@@ -150,6 +195,7 @@ class AgentCore:
 
 
 
+    @_writes
     def _add_to_self_memory(self, data):
         """After each session, save data that have been learnt"""
         if not data:
@@ -157,14 +203,16 @@ class AgentCore:
         
         if isinstance(data, str):
             self._learn_number_(data)
+            self.feel(data)  # the whole message at once, not set_mood per word
+            learnt = f"learnt: {datetime.utcnow().isoformat()}"
             for info in data.split():
-                self.set_mood(info)
-                self.memory["cool_info"][info] = f"learnt: {datetime.utcnow().isoformat()}"
-                self._push_json(type="memory")
+                self.memory["cool_info"][info] = learnt
+            self._push_json(type="memory")
 
 
             
 
+    @_writes
     def _learn_skill(self, skill_name: str):
         """Start learning a skill"""
         if skill_name not in self.skills:
@@ -173,10 +221,10 @@ class AgentCore:
                 "practice_sessions": 0,
                 "started_learning": datetime.utcnow().isoformat()
             }      
-        self.data["skills"] = self.skills
         self._push_json(type="data")
 
 
+    @_writes
     def practice_skill(self, skill_name: str, success: bool):
         if skill_name not in self.skills:
             self._learn_skill(skill_name)  
@@ -191,96 +239,122 @@ class AgentCore:
         self.skills[skill_name]["proficiency"] = min(
             1.0, self.skills[skill_name]["proficiency"]
         )  
-        self.data["skills"] = self.skills
         self._push_json(type="data")
 
                 
 
 
     
+    @_writes
     def set_mood(self, mood: str):
 
         triggered = False
         if "love" in mood.lower():
             triggered = True
             if self.connection_level < 4:
-                self.emotion = {
-                    "state": "nervous",
-                    "intensity": 0.8,
-                    "trigger": "awkward"
-                }
+                self.emotion.set("nervous", 0.8, "awkward")
 
                 self.mood_level += 0.5
                 self.connection_level += 0.8
 
             else:
-                self.emotion = {
-                    "state": "affectionate",
-                    "intensity": 0.6,
-                    "trigger": "love"
-                }
+                self.emotion.set("affectionate", 0.6, "love")
                 self.mood_level += 0.8
                 self.connection_level += 0.3
 
 
         if "hate" in mood.lower():
-            self.emotion = {
-                "state": "upset",
-                "intensity": 0.75,
-                "trigger": "hate"
-            }
+            self.emotion.set("upset", 0.75, "hate")
             self.mood_level += 0.6
             self.connection_level += 0.4
         
         elif "please" in mood.lower():
-            self.emotion = {
-                "state": "focused",
-                "intensity": 0.2,
-                "trigger": "please"
-            }
+            self.emotion.set("focused", 0.2, "please")
             self.mood_level += 0.7
         
         elif "death" in mood.lower() or "dying" in mood.lower():
             self.fear_check()
             triggered = True
         if mood == "average day":
-            self.emotion ={ 
-                "state": mood,
-                "intensity": 0.3
-            }
+            self.emotion.set(mood, 0.3)
 
         if not triggered:
         # Slowly return to baseline
-            self.emotion["intensity"] *= 0.9
-            if self.emotion["intensity"] < 0.1:
-                self.emotion = {
-                    "state": "neutral",
-                    "intensity": 0.3
-                }
+            self.emotion.intensity *= 0.9
+            if self.emotion.intensity < 0.1:
+                self.emotion.set("neutral", 0.3)
 
         self.mood_level = max(0, min(self.mood_level, 10))
         self.connection_level = max(0, min(self.connection_level, 10))
-        self.data["Current_Emotion"] = self.emotion
         self._push_json(type="data")
 
         
 
+    @_writes
+    def feel(self, message: str):
+        """
+        set_mood for a whole message in one step, scored by EmotionScorer.
+        The emotional words are applied in order, each as set_mood would,
+        and the plain words between and after them fade the emotion in
+        one go instead of one call per word.
+        """
+        score = self.scorer.score(message)
+        previous = -1
+        for position, kind in score.hits:
+            self._fade(position - previous - 1)
+            previous = position
+            if kind == LOVE:
+                if self.connection_level < 4:
+                    self.emotion.set("nervous", 0.8, "awkward")
+                    self.mood_level += 0.5
+                    self.connection_level += 0.8
+                else:
+                    self.emotion.set("affectionate", 0.6, "love")
+                    self.mood_level += 0.8
+                    self.connection_level += 0.3
+            elif kind == FEAR:
+                self.fear_check()
+            else:
+                mood, connection = WEIGHTS[kind]
+                if kind == HATE:
+                    self.emotion.set("upset", 0.75, "hate")
+                else:
+                    self.emotion.set("focused", 0.2, "please")
+                self.mood_level += mood
+                self.connection_level += connection
+                self._fade(1)  # set_mood fades on these words too
+        self._fade(score.words - previous - 1)
+
+        self.mood_level = max(0, min(self.mood_level, 10))
+        self.connection_level = max(0, min(self.connection_level, 10))
+        self._push_json(type="data")
+
+    def _fade(self, words: int):
+        """What `words` calls to set_mood without an emotional word do to the emotion"""
+        intensity = self.emotion.intensity
+        while words > 0:
+            intensity *= 0.9
+            words -= 1
+            if intensity < 0.1:
+                # back to neutral, from there the fade repeats every _NEUTRAL_CYCLE words
+                intensity = 0.3
+                words %= _NEUTRAL_CYCLE
+                self.emotion.set("neutral", 0.3)
+        self.emotion.intensity = intensity
+
+    @_writes
     def fear_check(self):
-        self.emotion = {
-            "state": random.choice(["scared", "fearful"]),
-            "intensity": 0.0,
-            "trigger": random.choice(["dead", "dying"])
-        }
+        self.emotion.set(random.choice(["scared", "fearful"]), 0.0, random.choice(["dead", "dying"]))
         if self.age < 1:
-            self.emotion["intensity"] = 1
+            self.emotion.intensity = 1
             self.mood_level += 0.5
             self.confidence_level = self.confidence_level
         elif 1 < self.age < 5:
-            self.emotion["intensity"] = 3
+            self.emotion.intensity = 3
             self.mood_level += 2
             self.confidence_level = self.confidence_level
         elif 5 < self.age < 13:
-            self.emotion["intensity"] = 8
+            self.emotion.intensity = 8
             self.mood_level += 5
             self.confidence_level = self.confidence_level
 
@@ -292,6 +366,7 @@ class AgentCore:
 
         
 
+    @_writes
     def update_age(self):
         delta = (datetime.now() - self.first_activation)
         self.age = delta.total_seconds() / 3600
@@ -302,12 +377,13 @@ class AgentCore:
 
 
     def introspec(self):
+        state = self.snapshot()
         thoughts = []
-        if self.age < 1:
+        if state["age"] < 1:
             thoughts.append("I am still new to this stuff. Everything feels very overwhelimg.")
-        elif self.age > 1:
+        elif state["age"] > 1:
             thoughts.append("There is so much to learn and process, I wonder what i'll learn froma  year from now.")
-        if self.emotion["state"] == "nervous":
+        if state["emotion"]["state"] == "nervous":
             thoughts.append("Why do I feel this way??? Is this normal behavior?")
         if random.random() < 0.1:  # 10% chance
             thoughts.append(random.choice([
@@ -319,17 +395,18 @@ class AgentCore:
         return random.choice(thoughts) if thoughts else None
     
 
+    @_writes
     def _learn_number_(self, data: str):
         numbers = [int(n) for n in re.findall(r"-?\d+", data)]
 
         for number in numbers:
             if str(number) not in self.memory["known_numbers"].keys():
                 self.memory["known_numbers"][number] = random.uniform(0.0, 10.0)
-                self.data["Memories"]["known_numbers"][number] = random.uniform(0.0, 10.0)
                 self._push_json(type="data")
                 self._push_json(type="memory")
         
 
+    @_writes
     def _fav_number_(self):
         """
         Codex's favorite number, 
@@ -355,6 +432,7 @@ class AgentCore:
         return favorite[0]
     
 
+    @_writes
     def emotional_awareness(self):
         """Change emotion depending on age"""
 
@@ -365,24 +443,13 @@ class AgentCore:
             self.age = (today - activation_date).days / 365
 
         if self.age < 1:
-            self.emotion = {
-                "state": "curious",
-                "intensity": 0.8
-            }
+            self.emotion.set("curious", 0.8)
 
         elif 1 <= self.age < 5:
-            self.emotion = {
-
-                "state": "fascinated",
-                "intensity": 0.5
-            }
+            self.emotion.set("fascinated", 0.5)
         
         elif self.age >= 10:
-            self.emotion = {
-                "state": "ambitious",
-                "intensity": 1.0
-            }
-        self.data["Current_Emotion"] = self.emotion
+            self.emotion.set("ambitious", 1.0)
         self._push_json(type="data")
 
 
@@ -390,19 +457,19 @@ class AgentCore:
 
     # GETTERS
     def get_mood_level(self) -> float:
-        return self.mood_level
+        return self._snapshot["mood_level"]
     
     def get_storage_path(self) -> Path:
         return self.storage_path
     
     def get_feeling(self) -> str:
-        return self.emotion['state']
+        return self._snapshot["emotion"]["state"]
     
     def get_activation_date(self) -> datetime:
         return self.first_activation
     
     def get_age(self) -> int:
-        return int(self.age)
+        return int(self._snapshot["age"])
     
     def get_name(self) -> str:
         return rf"{self.name}"
@@ -432,10 +499,15 @@ class AgentCore:
             "confidence_scale": self.confidence_level,
             "curiosity_scale": self.curiosity_level,
             "age": self.age, # hours/minutes for now
-            "Current_Emotion": self.emotion,
+            "Current_Emotion": self.emotion.to_dict(),
             "skills": self.skills,
             "Memories": self.memory,
         }
+    @property
+    def data(self) -> Dict:
+        """Codex_data.json, generated from the fields each time it is written"""
+        return self._get_data_()
+
     def get_(self):
         return self.data
     
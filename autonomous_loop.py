@@ -1,55 +1,132 @@
 # autonomous_loop.py
 
+import math
 import random
 from pathlib import Path
 from agent_core import AgentCore
 from prompt_engine import Personailty
+from thought_log import get_thought_log
 from datetime import datetime
+from typing import Dict, List
 import asyncio
+import heapq
 import json
+import time
 
 
 
 class AutonomousLoop:
-    def __init__(self, user_id: str, agent_core, storage_path: str = "codex/brain"):
+    """
+    Codex thinking on its own between messages.
+
+    Instead of waking every second to roll a 5% die, the loop sleeps
+    until the next thought is due. Gaps are drawn at random around
+    `think_every` seconds (same average pace as before). Once nobody has
+    talked for `idle_after` seconds the gaps keep doubling, up to
+    `max_idle_sleep`, and `notify_activity()` brings the pace straight
+    back.
+
+    Thoughts go to an append-only log (see ThoughtLog). Only the newest
+    `keep_thoughts` stay in `self.thoughts`, older ones are paged back
+    from disk with `recent_thoughts()`.
+    """
+
+    def __init__(self, user_id: str, agent_core, storage_path: str = "codex/brain",
+                 think_every: float = 20.0, idle_after: float = 300.0, max_idle_sleep: float = 1800.0,
+                 keep_thoughts: int = 200, max_log_bytes: int = 1 << 20, log_backups: int = 3):
         self.core = agent_core # agent_core AgentCore
         self.user = user_id
         # self.personailty = personailty
         self.storage = Path(storage_path)
-        self.thoughts = []
+        self.log = get_thought_log(
+            self.storage / f"{self.core.get_name()}_thoughts.jsonl",
+            max_bytes=max_log_bytes, backups=log_backups, keep=keep_thoughts
+        )
+        self.thoughts = self.log.recent  # newest `keep_thoughts`, oldest first
         self.short_term_thoughts = {}
         self.is_active: bool = True
+
+        self.think_every = think_every
+        self.idle_after = idle_after
+        self.max_idle_sleep = max_idle_sleep
+        self.last_activity = time.monotonic()
+        self._dirty = False
+        self._wake = None  # asyncio.Event of whatever is running this loop
+        self._event_loop = None
+        self.stats = {"wakeups": 0, "thoughts": 0, "writes": 0}
         self.boot_occuring_thoughts()
 
     def boot_occuring_thoughts(self):
-        self.save_thoughts()
-
-    def save_thoughts(self):
-        file_path = self.storage / f"{self.core.get_name()}_thoughts.json"
-        with open(file_path, 'w') as f:
-            json.dump(self.thoughts, f, indent=2)
+        self.save_thoughts(force=True)
 
+    def save_thoughts(self, force: bool = False):
+        """Push appended thoughts to disk"""
+        if not (self._dirty or force):
+            return
+        self.log.flush()
+        self._dirty = False
+        self.stats["writes"] += 1
+
+    def recent_thoughts(self, page: int = 0, page_size: int = 10) -> List[Dict]:
+        """Newest page first, each page oldest first (see ThoughtLog.page)"""
+        return self.log.page(page, page_size)
+
+    def notify_activity(self):
+        """Someone is talking, think at the normal pace again. Safe from any thread."""
+        self.last_activity = time.monotonic()
+        self.core.update_age()
+        self._poke()
+
+    def stop(self):
+        self.is_active = False
+        self._poke()
+
+    def _poke(self):
+        if self._wake is not None:
+            self._event_loop.call_soon_threadsafe(self._wake.set)
+
+    def next_delay(self) -> float:
+        """Seconds until the next thought"""
+        pace = self.think_every
+        idle = time.monotonic() - self.last_activity
+        if idle > self.idle_after:
+            # cap the exponent at max_idle_sleep, 2 ** (idle / idle_after)
+            # overflows a float after a few days idle
+            doublings = min(idle / self.idle_after, math.log2(max(1.0, self.max_idle_sleep / pace)))
+            pace = min(self.max_idle_sleep, pace * 2 ** doublings)
+        # exponential gaps: a thought is as likely in any second, like the old 5% roll
+        return random.expovariate(1 / pace)
+
+    def tick(self):
+        """One wake-up: a thought, then save it"""
+        self.stats["wakeups"] += 1
+        self.core.update_age()
+        thought = self.core.introspec()
+        if thought:
+            self.log.append({
+                "thoughts": thought,
+                "timestamp": datetime.utcnow().isoformat()
+            })
+            self._dirty = True
+            self.stats["thoughts"] += 1
+            print(f"\n[Codex thinking]: {thought}\n")
 
+        self.save_thoughts()
 
     async def live(self):
-        """Main existence loop"""
+        """Main existence loop, asleep until the next thought is due"""
+        self._event_loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
 
         while self.is_active:
-            if random.random() < 0.05: # 5%
-                thought = self.core.introspec()
-                if thought:
-                    self.thoughts.append({
-                        "thoughts": thought,
-                        "timestamp": datetime.utcnow().isoformat()
-                    })
-                    print(f"\n[Codex thinking]: {thought}\n")
-
-            self.save_thoughts()
-
-            self.core.update_age()
-            
-
-            await asyncio.sleep(1)
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.next_delay())
+                # woken by activity (or stop), the pace may have changed
+                self._wake.clear()
+                continue
+            except asyncio.TimeoutError:
+                pass
+            self.tick()
 
 
     async def initiate_conversation(self):
@@ -85,10 +162,51 @@ class AutonomousLoop:
         folder = Path(folder)
         try:
             with open(folder, 'w') as f:
-                json.dump(self.thoughts, f, indent=2)
+                json.dump(list(self.thoughts), f, indent=2)
         except Exception as e:
             print(f"There was an Error when creating file in => [autonomous_loop.py]. Details: {e}")
 
+
+
+async def live_together(loops: List[AutonomousLoop]):
+    """
+    Many agents' loops on one event loop with a single timer between them.
+    Each loop's next thought sits in a heap, only the earliest is waited
+    for, so a thousand idle agents cost one sleeping task.
+    """
+    event_loop = asyncio.get_running_loop()
+    wake = asyncio.Event()
+    due = []
+    planned = {}  # id(loop) -> (generation, last_activity it was planned with)
+
+    def plan(loop: AutonomousLoop):
+        generation = planned.get(id(loop), (0, 0))[0] + 1
+        planned[id(loop)] = (generation, loop.last_activity)
+        heapq.heappush(due, (time.monotonic() + loop.next_delay(), generation, id(loop), loop))
+
+    for loop in loops:
+        loop._event_loop = event_loop
+        loop._wake = wake
+        plan(loop)
+
+    while due:
+        when, generation, key, loop = due[0]
+        if generation != planned[key][0] or not loop.is_active:
+            heapq.heappop(due)  # replanned or stopped meanwhile
+            continue
+        try:
+            await asyncio.wait_for(wake.wait(), max(0.0, when - time.monotonic()))
+            wake.clear()
+            for loop in loops:
+                if loop.is_active and loop.last_activity != planned[id(loop)][1]:
+                    plan(loop)
+            continue
+        except asyncio.TimeoutError:
+            pass
+        heapq.heappop(due)
+        loop.tick()
+        plan(loop)
+
         
 if __name__ == "__main__":
     ...
@@ -0,0 +1,115 @@
+# context_budget.py
+
+import re
+from collections import deque
+from typing import Dict, List, Sequence, Tuple
+
+
+PIECE = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough Llama-style token count without a tokenizer: one token per
+    word or punctuation mark, plus one per 6 extra letters of long words.
+    Close enough to budget with, and microseconds instead of a tokenizer call.
+    """
+    if not text:
+        return 0
+    return sum(1 + (len(piece) - 1) // 6 for piece in PIECE.findall(text))
+
+
+def _clip(text: str, words: int) -> str:
+    parts = text.split()
+    return " ".join(parts[:words]) + (" ..." if len(parts) > words else "")
+
+
+class ContextBuilder:
+    """
+    Fits the conversation history of one user into a token budget.
+
+    The newest turns are kept word for word, up to `history_tokens` and
+    whatever room the system prompt leaves in `window` minus `reserve`
+    (tokens kept free for the reply). Turns that no longer fit are folded
+    into a rolling note, one short line each, capped at `note_tokens`
+    (oldest lines go first). The note is built from the turns themselves,
+    no extra model call.
+    """
+
+    def __init__(self, window: int = 8192, reserve: int = 1024,
+                 history_tokens: int = 2048, note_tokens: int = 256, note_words: int = 20):
+        self.window = window
+        self.reserve = reserve
+        self.history_tokens = history_tokens
+        self.note_tokens = note_tokens
+        self.note_words = note_words
+
+        self._note = deque()  # (line, tokens)
+        self._note_size = 0
+        self._folded_upto = ""  # date of the newest turn already in the note
+        self.last_report: Dict = {}
+
+    def reset(self):
+        self._note.clear()
+        self._note_size = 0
+        self._folded_upto = ""
+
+    def note(self) -> str:
+        if not self._note:
+            return ""
+        return "\n\nEARLIER IN THIS CONVERSATION:\n" + "\n".join(line for line, _ in self._note)
+
+    def fold(self, turns: Sequence[Dict]):
+        """Add turns to the note, e.g. ones pushed out of the buffer before fit() saw them go"""
+        for turn in turns:
+            if turn.get("date", "") <= self._folded_upto:
+                continue
+            self._folded_upto = turn.get("date", "")
+            who = "They" if turn["role"] == "user" else "You"
+            line = f"- {who} said: {_clip(turn.get('response') or turn.get('content') or '', self.note_words)}"
+            tokens = estimate_tokens(line)
+            self._note.append((line, tokens))
+            self._note_size += tokens
+        while self._note_size > self.note_tokens and self._note:
+            _, tokens = self._note.popleft()
+            self._note_size -= tokens
+
+    def fit(self, history: Sequence[Dict], system_prompt: str,
+            current_message: str) -> Tuple[List[Dict], str, Dict]:
+        """
+        Returns (kept turns oldest first, rolling note, tokens per section).
+        The current message is sent on its own, so if it is also the last
+        turn of `history` it is left out here.
+        """
+        history = list(history)
+        if history and history[-1]["role"] == "user" and history[-1].get("response") == current_message:
+            history.pop()
+
+        system = estimate_tokens(system_prompt)
+        current = estimate_tokens(current_message)
+        note_room = self.note_tokens if len(history) else 0
+        budget = min(self.history_tokens, self.window - self.reserve - system - current - note_room)
+
+        used = 0
+        start = len(history)
+        while start > 0:
+            tokens = estimate_tokens(history[start - 1].get("response") or history[start - 1].get("content") or "") + 4
+            if used + tokens > budget:
+                break
+            used += tokens
+            start -= 1
+
+        self.fold(history[:start])
+        note = self.note()
+
+        self.last_report = {
+            "system": system,
+            "note": self._note_size,
+            "history": used,
+            "current": current,
+            "total": system + self._note_size + used + current,
+            "turns_kept": len(history) - start,
+            "turns_folded": start,
+            "budget": self.window - self.reserve
+        }
+        return history[start:], note, self.last_report
@@ -0,0 +1,123 @@
+# conversation_buffer.py
+
+import atexit
+import gzip
+import json
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional
+
+
+class BufferWindow(Sequence):
+    """
+    Read-only view over the last turns of a ConversationBuffer.
+    Nothing is copied, so the view follows the buffer: read it before
+    the next turn is appended.
+    """
+
+    def __init__(self, buffer: "ConversationBuffer", length: int):
+        self._buffer = buffer
+        self._length = length
+
+    def __len__(self) -> int:
+        return min(self._length, len(self._buffer))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        size = len(self)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("window index out of range")
+        return self._buffer[len(self._buffer) - size + index]
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+
+class ConversationBuffer:
+    """
+    Fixed-capacity ring of conversation turns.
+
+    Appending and evicting are O(1). When full, the oldest turn is
+    overwritten and handed to `spill` (if given) so it can be kept on disk.
+    """
+
+    def __init__(self, capacity: int = 100, spill: Optional[Callable[[Dict], None]] = None):
+        self.capacity = capacity
+        self.spill = spill
+        self._items = [None] * capacity
+        self._start = 0
+        self._size = 0
+
+    def append(self, turn: Dict):
+        if self._size < self.capacity:
+            self._items[(self._start + self._size) % self.capacity] = turn
+            self._size += 1
+            return
+
+        evicted = self._items[self._start]
+        self._items[self._start] = turn
+        self._start = (self._start + 1) % self.capacity
+        if self.spill:
+            self.spill(evicted)
+
+    def window(self, last: int) -> BufferWindow:
+        """The `last` most recent turns"""
+        return BufferWindow(self, last)
+
+    def clear(self):
+        """Drop every turn, spilling them first"""
+        if self.spill:
+            for turn in self:
+                self.spill(turn)
+        self._items = [None] * self.capacity
+        self._start = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, index: int) -> Dict:
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("buffer index out of range")
+        return self._items[(self._start + index) % self.capacity]
+
+    def __iter__(self) -> Iterator[Dict]:
+        for index in range(self._size):
+            yield self._items[(self._start + index) % self.capacity]
+
+
+class GzipTranscript:
+    """Appends spilled turns to a gzip-compressed JSONL file"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = None
+        atexit.register(self.close)
+
+    def __call__(self, turn: Dict):
+        try:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                # every session adds a new gzip member, readers see one stream
+                self._file = gzip.open(self.path, 'at', encoding="utf-8")
+            self._file.write(json.dumps(turn) + "\n")
+        except Exception as e:
+            print(f"[GzipTranscript] could not save turn to {self.path}: {e}")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def read(self) -> Iterator[Dict]:
+        self.close()  # finish the open gzip member so it can be read back
+        if not self.path.exists():
+            return
+        with gzip.open(self.path, 'rt', encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
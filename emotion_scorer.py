@@ -0,0 +1,135 @@
+# emotion_scorer.py
+
+import re
+import time
+from collections import namedtuple
+from typing import Dict, List
+
+
+# the words set_mood reacts to, with the forms a substring check used to catch
+LOVE, HATE, PLEASE, FEAR = 1, 2, 3, 4
+LEXICON: Dict[int, List[str]] = {
+    LOVE: ["love", "loves", "loved", "lovely", "lover", "lovers", "iloveyou"],
+    HATE: ["hate", "hates", "hated", "hater", "haters", "hateful"],
+    PLEASE: ["please", "pleased"],
+    FEAR: ["death", "deaths", "dying"],
+}
+# (mood, connection) each word adds. Love depends on how close Codex
+# already feels, so AgentCore.feel weighs it
+WEIGHTS = {
+    HATE: (0.6, 0.4),
+    PLEASE: (0.7, 0.0),
+}
+
+TOKEN = re.compile(r"\w+")
+
+# hits: (position, kind) of every emotional word, in message order
+MoodScore = namedtuple("MoodScore", ["mood", "connection", "counts", "hits", "words"])
+
+
+class EmotionScorer:
+    """
+    Scores a whole message against the emotion lexicon in one pass.
+
+    The message is lowercased and split once. Each word is mapped to an
+    id in the lexicon table (0 for every other word), and the mood and
+    connection weights are gathered and summed for all words together,
+    with NumPy arrays when NumPy is installed (and the message is long
+    enough for it to pay off), plain Python otherwise. NumPy is imported
+    on the first long message, not at start-up. The emotional words are
+    also returned in order, since how they add up depends on it.
+    """
+
+    def __init__(self, numpy_after: int = 256):
+        self.numpy_after = numpy_after
+        self.kinds = [0]
+        self.ids: Dict[str, int] = {}
+        for kind, words in LEXICON.items():
+            for word in words:
+                self.ids[word] = len(self.kinds)
+                self.kinds.append(kind)
+        self.mood = [WEIGHTS.get(kind, (0.0, 0.0))[0] for kind in self.kinds]
+        self.connection = [WEIGHTS.get(kind, (0.0, 0.0))[1] for kind in self.kinds]
+        self.np = None
+        self._numpy_missing = False
+
+    def _numpy(self):
+        if self.np is None and not self._numpy_missing:
+            try:
+                import numpy
+            except ImportError:
+                self._numpy_missing = True
+                return None
+            self._kinds = numpy.array(self.kinds, dtype=numpy.int8)
+            self._weights = numpy.array([self.mood, self.connection], dtype=numpy.float64)
+            self.np = numpy
+        return self.np
+
+    def score(self, message: str) -> MoodScore:
+        lookup = self.ids.get
+        ids = [lookup(word, 0) for word in TOKEN.findall(message.lower())]
+        if len(ids) >= self.numpy_after and self._numpy() is not None:
+            return self._score_numpy(ids)
+
+        counts = [0] * 5
+        mood = connection = 0.0
+        hits = []
+        for position, i in enumerate(ids):
+            if i:
+                kind = self.kinds[i]
+                counts[kind] += 1
+                mood += self.mood[i]
+                connection += self.connection[i]
+                hits.append((position, kind))
+        counts[0] = len(ids) - sum(counts)
+        return MoodScore(mood, connection, counts, hits, len(ids))
+
+    def _score_numpy(self, ids: List[int]) -> MoodScore:
+        np = self.np
+        ids = np.fromiter(ids, dtype=np.int32, count=len(ids))
+        mood, connection = self._weights[:, ids].sum(axis=1)
+        kinds = self._kinds[ids]
+        counts = np.bincount(kinds, minlength=5).tolist()
+        positions = np.flatnonzero(kinds)
+        hits = list(zip(positions.tolist(), kinds[positions].tolist()))
+        return MoodScore(float(mood), float(connection), counts, hits, len(ids))
+
+
+_shared = None
+
+
+def get_scorer() -> EmotionScorer:
+    """One lexicon table, shared by every AgentCore"""
+    global _shared
+    if _shared is None:
+        _shared = EmotionScorer()
+    return _shared
+
+
+if __name__ == "__main__":
+    import atexit
+    import tempfile
+    from agent_core import AgentCore
+
+    # one message through the old per-word set_mood path vs one feel()
+    unit = "i love playing soccer with my friends but i hate homework please help me not die of boredom "
+    get_scorer().score(unit * 100)  # load NumPy now, not inside a timed row
+    print(f"{'words':>8}{'per-word ms':>14}{'feel ms':>10}{'speed-up':>10}")
+    for words in (10, 100, 1_000, 10_000):
+        message = " ".join((unit.split() * (words // len(unit.split()) + 1))[:words])
+        with tempfile.TemporaryDirectory() as scratch:
+            core = AgentCore(storage_path=scratch)
+            start = time.perf_counter()
+            for word in message.split():
+                core.set_mood(word)
+            core.flush()
+            per_word = time.perf_counter() - start
+            atexit.unregister(core.store.flush)
+
+            core = AgentCore(storage_path=scratch)
+            start = time.perf_counter()
+            core.feel(message)
+            core.flush()
+            batched = time.perf_counter() - start
+            atexit.unregister(core.store.flush)
+        print(f"{words:>8}{per_word * 1000:>14.2f}{batched * 1000:>10.3f}{per_word / batched:>9.0f}x")
@@ -0,0 +1,57 @@
+# emotional_state.py
+
+from typing import Dict, Optional
+
+
+class EmotionalState:
+    """
+    Codex's current emotion, changed in place.
+
+    Three slots instead of a new dict per mood change. Old code that
+    reads it like a dict (`emotion["state"]`) still works, and
+    `to_dict()` builds the JSON form only when a file is written.
+    """
+
+    __slots__ = ("state", "intensity", "trigger")
+
+    def __init__(self, state: str = "average day", intensity: float = 0.32, trigger: Optional[str] = None):
+        self.state = state
+        self.intensity = intensity
+        self.trigger = trigger
+
+    def set(self, state: str, intensity: float, trigger: Optional[str] = None):
+        self.state = state
+        self.intensity = intensity
+        self.trigger = trigger
+
+    def to_dict(self) -> Dict:
+        if self.trigger is None:
+            return {"state": self.state, "intensity": self.intensity}
+        return {"state": self.state, "intensity": self.intensity, "trigger": self.trigger}
+
+    # dict-style access, for code written against the old emotion dict
+    def __getitem__(self, key: str):
+        if key not in self.__slots__ or (key == "trigger" and self.trigger is None):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key: str, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.__slots__ and (key != "trigger" or self.trigger is not None)
+
+    def get(self, key: str, default=None):
+        return self[key] if key in self else default
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, EmotionalState):
+            return self.to_dict() == other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"EmotionalState({self.state!r}, {self.intensity!r}, {self.trigger!r})"
@@ -0,0 +1,186 @@
+# fact_extraction.py
+
+import re
+import time
+from collections import namedtuple
+from itertools import product
+from pathlib import Path
+from typing import Dict, List
+import yaml
+
+
+Fact = namedtuple("Fact", ["kind", "value", "position"])
+Rule = namedtuple("Rule", ["kind", "phrases", "shape", "exclude"])
+
+
+RULES_PATH = "persona/fact_rules.yaml"
+SHAPES = ("word", "words", "number", "phrase", "before")
+
+TOKEN = re.compile(r"\w+(?:'\w+)?")
+_END = object()
+_shared: Dict[str, "FactExtractor"] = {}
+
+
+class FactExtractor:
+    """
+    Finds facts about the user in one pass over the message.
+
+    The rules live in persona/fact_rules.yaml. Their trigger phrases are
+    compiled into a word trie when the file is loaded, and again only when
+    its mtime changes, so rules can be tuned while Codex is running.
+    The message is split into words once, then from each word the trie is
+    followed for at most the length of the longest trigger, so cost grows
+    linearly with the message and no regex ever backtracks over user text.
+    """
+
+    def __init__(self, path: str = RULES_PATH, check_every: float = 1.0):
+        self.path = Path(path)
+        self.check_every = check_every  # seconds between mtime checks
+        self.reloads = 0
+
+        self._mtime = None
+        self._checked = 0.0
+        # (rules, trie, connectors, max_words), swapped in one piece on reload
+        self._compiled = ([], {}, set(), 0)
+        self.reload_if_changed(force=True)
+
+    @property
+    def rules(self) -> List[Rule]:
+        return self._compiled[0]
+
+    def reload_if_changed(self, force: bool = False) -> bool:
+        now = time.monotonic()
+        if not force and now - self._checked < self.check_every:
+            return False
+        self._checked = now
+
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except OSError as e:
+            if force:
+                print(f"[FactExtractor] no rule file, nothing will be learnt: {e}")
+            return False
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+
+        try:
+            with open(self.path, 'r') as f:
+                self._compiled = self._compile(yaml.safe_load(f))
+        except Exception as e:
+            # keep the rules we already have until the file is fixed
+            print(f"[FactExtractor] PROBLEM WHEN LOADING {self.path}, DETAILS: {e}")
+            return False
+        self.reloads += 1
+        return True
+
+    @staticmethod
+    def _compile(config: Dict):
+        rules = []
+        for entry in config["rules"]:
+            if entry["shape"] not in SHAPES:
+                raise ValueError(f"unknown shape '{entry['shape']}' for {entry['kind']}")
+            rules.append(Rule(
+                entry["kind"],
+                [str(phrase) for phrase in entry["phrases"]],
+                entry["shape"],
+                {str(word) for word in entry.get("exclude") or []}
+            ))
+
+        trie: Dict = {}
+        for index, rule in enumerate(rules):
+            for phrase in rule.phrases:
+                choices = [word.split("|") for word in phrase.lower().split()]
+                for words in product(*choices):
+                    node = trie
+                    for word in words:
+                        node = node.setdefault(word, {})
+                    node.setdefault(_END, []).append(index)
+
+        connectors = {str(word) for word in config.get("connectors") or []}
+        return rules, trie, connectors, int(config.get("max_words", 4))
+
+    def extract(self, message: str) -> List[Fact]:
+        self.reload_if_changed()
+        rules, trie, connectors, max_words = self._compiled
+
+        text = message.lower().replace("’", "'")
+        spans = [(m.start(), m.end()) for m in TOKEN.finditer(text)]
+        words = [text[start:end] for start, end in spans]
+        count = len(words)
+
+        def joined(left: int, right: int) -> bool:
+            """only whitespace between word `left` and word `right`"""
+            return text[spans[left][1]:spans[right][0]].isspace()
+
+        found = []
+        for i in range(count):
+            node = trie
+            j = i
+            while j < count:
+                if j > i and not joined(j - 1, j):
+                    break
+                node = node.get(words[j])
+                if node is None:
+                    break
+                j += 1
+                for index in node.get(_END, ()):
+                    rule = rules[index]
+                    value = self._capture(rule.shape, text, spans, words, i, j, joined,
+                                          connectors, max_words)
+                    if value and value not in rule.exclude:
+                        found.append((index, i, Fact(rule.kind, value, spans[i][0])))
+
+        found.sort(key=lambda item: (item[0], item[1]))
+        return [fact for _, _, fact in found]
+
+    @staticmethod
+    def _capture(shape, text, spans, words, i, j, joined, connectors, max_words):
+        count = len(words)
+        if shape == "phrase":
+            return text[spans[i][0]:spans[j - 1][1]]
+        if shape == "before":
+            if i > 0 and j < count and joined(i - 1, i) and joined(j - 1, j):
+                return words[i - 1]
+            return None
+        if j >= count or not joined(j - 1, j):
+            return None
+        if shape == "word":
+            return words[j]
+        if shape == "number":
+            return words[j] if words[j].isdigit() else None
+        if shape == "words":
+            end = j
+            while (end < count and end - j < max_words and words[end] not in connectors
+                   and (end == j or joined(end - 1, end))):
+                end += 1
+            return " ".join(words[j:end]) or None
+        return None
+
+
+def get_extractor(path: str = RULES_PATH) -> FactExtractor:
+    """One compiled extractor per rule file, shared by every user"""
+    if path not in _shared:
+        _shared[path] = FactExtractor(path)
+    return _shared[path]
+
+
+if __name__ == "__main__":
+    extractor = FactExtractor()
+    print(extractor.extract("My name is Julius, I like to play overwatch, and my favorite number is 666"))
+    print()
+
+    samples = {
+        "chat": "hey so i play pac man or subway surfers and i can't stand homework. ",
+        "no spaces": "a",
+        "triggers only": "i am i am i'm i love ",
+        "or chain": "x or ",
+    }
+    print(f"{'message':<15}{'chars':>10}{'ms':>10}{'us/char':>10}")
+    for name, unit in samples.items():
+        for size in (1_000, 10_000, 100_000):
+            message = (unit * (size // len(unit) + 1))[:size]
+            start = time.perf_counter()
+            extractor.extract(message)
+            took = time.perf_counter() - start
+            print(f"{name:<15}{size:>10}{took * 1000:>10.2f}{took / size * 1e6:>10.3f}")
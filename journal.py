@@ -0,0 +1,190 @@
+# journal.py
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+def atomic_write_json(path, obj, indent: int = 2) -> bool:
+    """
+    Write JSON through a temp file + rename, so readers only ever see the
+    old file or the complete new one, never a truncated one.
+    """
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.tmp")
+    try:
+        with open(tmp, 'w') as f:
+            json.dump(obj, f, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        return True
+    except Exception as e:
+        print(f"[atomic_write_json] PROBLEM WHEN WRITING {path}: {e}")
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+        return False
+
+
+def diff(old, new, path: Optional[List] = None) -> List[Dict]:
+    """List of set/del operations turning `old` into `new` (both JSON data)"""
+    path = path or []
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        if old == new:
+            return []
+        return [{"op": "set", "path": path, "value": new}]
+
+    ops = []
+    for key, value in new.items():
+        if key not in old:
+            ops.append({"op": "set", "path": path + [key], "value": value})
+        elif old[key] != value:
+            ops.extend(diff(old[key], value, path + [key]))
+    for key in old:
+        if key not in new:
+            ops.append({"op": "del", "path": path + [key]})
+    return ops
+
+
+def apply(state, ops: List[Dict]):
+    """Replay operations produced by `diff`. Both ops are idempotent."""
+    for op in ops:
+        keys = op["path"]
+        if not keys:
+            if op["op"] == "set":
+                state = op["value"]
+            continue
+
+        target = state
+        for key in keys[:-1]:
+            if not isinstance(target.get(key), dict):
+                target[key] = {}
+            target = target[key]
+
+        if op["op"] == "set":
+            target[keys[-1]] = op["value"]
+        elif op["op"] == "del":
+            target.pop(keys[-1], None)
+    return state
+
+
+class JournaledFile:
+    """
+    A JSON file stored as a snapshot plus an append-only journal.
+
+    `save()` appends only the delta against what is already on disk. Once
+    the journal grows past `compact_every` records or `compact_bytes`, the
+    state is written out as a fresh snapshot (temp file + rename) and the
+    journal is cleared. `load()` reads the snapshot and replays the journal,
+    stopping at a torn last line left behind by a crash; the good records
+    are then compacted into the snapshot, so later appends never land
+    after the torn line.
+    """
+
+    def __init__(self, path, compact_every: int = 200, compact_bytes: int = 256 * 1024):
+        self.path = Path(path)
+        self.journal_path = self.path.with_name(self.path.name + ".journal")
+        self.compact_every = compact_every
+        self.compact_bytes = compact_bytes
+
+        self._committed = None  # what snapshot + journal add up to
+        self._records = 0
+        self.stats = {
+            "appends": 0,
+            "snapshots": 0,
+            "fsyncs": 0,
+            "parses": 0
+        }
+
+    def exists(self) -> bool:
+        return self.path.exists() or self.journal_path.exists()
+
+    def load(self, default=None):
+        """Recover the latest state, `default` if nothing was ever saved"""
+        state = None
+        if self.path.exists():
+            try:
+                with open(self.path, 'r') as f:
+                    state = json.load(f)
+                self.stats["parses"] += 1
+            except Exception as e:
+                print(f"[JournaledFile] snapshot {self.path} is unreadable, replaying journal only: {e}")
+
+        if state is None:
+            state = json.loads(json.dumps(default if default is not None else {}))
+
+        self._records = 0
+        torn = False
+        if self.journal_path.exists():
+            with open(self.journal_path, 'r') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        torn = True  # torn write at the tail, everything after it is lost anyway
+                        break
+                    state = apply(state, record["ops"])
+                    self._records += 1
+                    if not line.endswith("\n"):
+                        torn = True  # the next append would join this line
+            self.stats["parses"] += 1
+
+        self._committed = json.loads(json.dumps(state))
+        if torn or self._records >= self.compact_every:
+            self.compact()
+        return state
+
+    def save(self, obj) -> bool:
+        """Persist `obj`, appending a delta when possible"""
+        try:
+            state = json.loads(json.dumps(obj))
+        except Exception as e:
+            print(f"ERROR when updating file: {e}")
+            return False
+
+        if self._committed is None:
+            self._committed = state
+            return self.compact()
+
+        ops = diff(self._committed, state)
+        if not ops:
+            return True
+
+        try:
+            with open(self.journal_path, 'a') as f:
+                f.write(json.dumps({"ops": ops}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+                size = f.tell()
+        except Exception as e:
+            print(f"ERROR when updating file: {e}")
+            return False
+
+        self.stats["appends"] += 1
+        self.stats["fsyncs"] += 1
+        self._committed = state
+        self._records += 1
+
+        if self._records >= self.compact_every or size >= self.compact_bytes:
+            self.compact()
+        return True
+
+    def compact(self) -> bool:
+        """Fold the journal into a new snapshot"""
+        if not atomic_write_json(self.path, self._committed):
+            return False
+        self.stats["snapshots"] += 1
+        self.stats["fsyncs"] += 1
+
+        # the snapshot already holds every journaled op, replaying them
+        # again after a crash right here would be harmless
+        try:
+            if self.journal_path.exists():
+                self.journal_path.unlink()
+        except OSError as e:
+            print(f"[JournaledFile] could not clear {self.journal_path}: {e}")
+        self._records = 0
+        return True
@@ -56,9 +56,10 @@ def main():
                 continue
             
             print("\n=> CODEX: ", end="", flush=True)
-            response = agent.chat(user_input)
-            print(response)
-            print(f"EMOTION: {}")
+            for piece in agent.stream_chat(user_input):
+                print(piece, end="", flush=True)
+            print()
+            print(f"EMOTION: {agent.core.get_feeling()}")
             print()
             
         except KeyboardInterrupt:
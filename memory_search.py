@@ -1,35 +1,318 @@
 # memory_search.py
 
 
-from typing import Dict, List
+import heapq
+import math
+import re
+import zlib
+from itertools import combinations
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+
+TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN.findall(str(text).lower())
+
+
+class FactIndex:
+    """
+    Inverted index over fact names (token -> fact -> term count).
+
+    selfaware adds a fact the moment it learns it, so nothing is rebuilt
+    per query. Queries are scored with BM25 and only the facts sharing a
+    token with the query are ever looked at.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.lengths: Dict[str, int] = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def __contains__(self, fact_name: str) -> bool:
+        return fact_name in self.lengths
+
+    def add(self, fact_name: str):
+        if fact_name in self.lengths:
+            self.remove(fact_name)
+        tokens = tokenize(fact_name)
+        for token in tokens:
+            counts = self.postings.setdefault(token, {})
+            counts[fact_name] = counts.get(fact_name, 0) + 1
+        self.lengths[fact_name] = len(tokens)
+        self.total_length += len(tokens)
+
+    def remove(self, fact_name: str):
+        if fact_name not in self.lengths:
+            return
+        for token in set(tokenize(fact_name)):
+            counts = self.postings.get(token, {})
+            counts.pop(fact_name, None)
+            if not counts:
+                self.postings.pop(token, None)
+        self.total_length -= self.lengths.pop(fact_name)
+
+    def rebuild(self, fact_names: Iterable[str]):
+        self.postings = {}
+        self.lengths = {}
+        self.total_length = 0
+        for fact_name in fact_names:
+            self.add(fact_name)
+
+    def search(self, query: str, k: int = 3) -> List[Tuple[float, str]]:
+        """Top `k` (score, fact_name) pairs, best first"""
+        if not self.lengths:
+            return []
+        count = len(self.lengths)
+        average = (self.total_length / count) or 1.0
+
+        scores: Dict[str, float] = {}
+        for token in set(tokenize(query)):
+            counts = self.postings.get(token)
+            if not counts:
+                continue
+            idf = math.log(1 + (count - len(counts) + 0.5) / (len(counts) + 0.5))
+            for fact_name, tf in counts.items():
+                norm = tf + self.k1 * (1 - self.b + self.b * self.lengths[fact_name] / average)
+                scores[fact_name] = scores.get(fact_name, 0.0) + idf * tf * (self.k1 + 1) / norm
+
+        return heapq.nlargest(k, ((score, name) for name, score in scores.items()))
+
+
+def _numpy():
+    """NumPy is only needed for vector search, import it on first use"""
+    import numpy
+    return numpy
+
+
+class VectorIndex:
+    """
+    Facts as unit vectors in a NumPy matrix, searched by cosine similarity.
+
+    By default a fact is embedded as hashed character 3-grams of its words,
+    which is cheap, CPU-only and catches spelling variants ("soccer" and
+    "soccer games"). Pass `embed` (list of texts -> 2D array) to use a local
+    embedding model for real synonyms ("soccer" and "football").
+    Up to `approximate_after` facts every row is scored in one matrix
+    product, past that `tables` random-hyperplane LSH tables narrow the
+    candidates. When fewer than `k` of them are similar enough the search
+    falls back to scoring every row, so a miss costs time, not results.
+    """
+
+    def __init__(self, dim: int = 512, embed: Optional[Callable] = None,
+                 approximate_after: int = 5000, planes: int = 14, tables: int = 12):
+        self.np = _numpy()
+        self.dim = dim
+        self._embed = embed
+        self.approximate_after = approximate_after
+
+        self.names: List[str] = []
+        self.matrix = None  # rows [0, len(names)) are in use
+        self._planes = None
+        self._planes_count = planes
+        self._tables = tables
+        self._buckets: List[Dict[int, List[int]]] = [{} for _ in range(tables)]
+        bits = [1 << bit for bit in range(planes)]
+        self._probes = [0] + bits + [a | b for a, b in combinations(bits, 2)]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def embed(self, texts: List[str]):
+        np = self.np
+        if self._embed is not None:
+            vectors = np.asarray(self._embed(texts), dtype=np.float32)
+        else:
+            vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+            for row, text in enumerate(texts):
+                for word in tokenize(text):
+                    padded = f" {word} "
+                    for i in range(max(1, len(padded) - 2)):
+                        h = zlib.crc32(padded[i:i + 3].encode())
+                        vectors[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def add_many(self, fact_names: List[str]):
+        if not fact_names:
+            return
+        np = self.np
+        vectors = self.embed(fact_names)
+        if self.matrix is None:
+            self.matrix = np.zeros((max(64, len(vectors)), vectors.shape[1]), dtype=np.float32)
+        start = len(self.names)
+        needed = start + len(vectors)
+        if needed > len(self.matrix):
+            grown = np.zeros((max(needed, 2 * len(self.matrix)), self.matrix.shape[1]), dtype=np.float32)
+            grown[:start] = self.matrix[:start]
+            self.matrix = grown
+        self.matrix[start:needed] = vectors
+        self.names.extend(fact_names)
+
+        if self._planes is not None:
+            self._hash_rows(start, needed)
+        elif needed > self.approximate_after:
+            rng = np.random.default_rng(0)
+            planes = rng.standard_normal((self._tables * self._planes_count, self.matrix.shape[1]))
+            self._planes = planes.astype(np.float32)
+            self._hash_rows(0, needed)
+
+    def _signatures(self, vectors):
+        """One signature per table for each vector, shape (len(vectors), tables)"""
+        bits = ((vectors @ self._planes.T) > 0).reshape(len(vectors), self._tables, self._planes_count)
+        return bits @ (1 << self.np.arange(self._planes_count))
+
+    def _hash_rows(self, start: int, end: int):
+        for offset, signatures in enumerate(self._signatures(self.matrix[start:end])):
+            for buckets, signature in zip(self._buckets, signatures):
+                buckets.setdefault(int(signature), []).append(start + offset)
+
+    def _candidates(self, query, k: int):
+        if self._planes is None:
+            return None
+        hits = []
+        for buckets, signature in zip(self._buckets, self._signatures(query[None, :])[0]):
+            signature = int(signature)
+            for flips in self._probes:  # every bucket up to two bits away
+                hits.extend(buckets.get(signature ^ flips, ()))
+        rows = self.np.unique(self.np.asarray(hits, dtype=self.np.int64))
+        return rows if len(rows) >= k else None
+
+    def search(self, query: str, k: int = 3, min_similarity: float = 0.2,
+               exact: bool = False) -> List[Tuple[float, str]]:
+        """Top `k` (cosine, fact_name) pairs, best first. `exact` skips LSH."""
+        if not self.names:
+            return []
+        np = self.np
+        vector = self.embed([query])[0]
+        rows = None if exact else self._candidates(vector, k)
+        if rows is not None:
+            scores = self.matrix[rows] @ vector
+            if (scores >= min_similarity).sum() < k:
+                rows = None  # the tables missed, better slow than short
+        if rows is None:
+            scores = self.matrix[:len(self.names)] @ vector
+            rows = np.arange(len(self.names))
+
+        if len(scores) > k:
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.names[int(rows[i])]) for i in top if scores[i] >= min_similarity]
 
 
 class MemorySearch:
-    """Search through memories to find relevant context"""
-    
-    def __init__(self, user_memory):
+    """
+    Search through memories to find relevant context
+
+    mode: "keyword" (BM25), "vector" (VectorIndex) or "hybrid" (both,
+    scores blended). Vector modes need NumPy and fall back to keywords
+    without it.
+    """
+
+    def __init__(self, user_memory, mode: str = "keyword", embed: Optional[Callable] = None):
         self.memory = user_memory
-    
-    def search_facts(self, query: str) -> List[Dict]:
+        self.mode = mode
+        self.embed = embed
+
+    def _index(self) -> FactIndex:
+        index = getattr(self.memory, "fact_index", None)
+        if index is None:
+            # not a selfaware, index what it has once
+            index = FactIndex()
+            index.rebuild(self.memory.get_current_user_info()["facts"])
+            self.memory.fact_index = index
+        return index
+
+    def _vectors(self) -> Optional[VectorIndex]:
+        index = getattr(self.memory, "vector_index", None)
+        if index is None:
+            try:
+                index = VectorIndex(embed=self.embed)
+            except ImportError:
+                print("[MemorySearch] NumPy is not installed, using keyword search")
+                self.mode = "keyword"
+                return None
+            self.memory.vector_index = index
+
+        # facts are only ever appended, embed the ones added since last time
+        facts = self.memory.get_current_user_info()["facts"]
+        if len(index) < len(facts):
+            index.add_many(list(facts)[len(index):])
+        return index
+
+    def _ranked(self, query: str, k: int) -> List[Tuple[float, str]]:
+        if self.mode == "keyword":
+            return self._index().search(query, k)
+
+        vectors = self._vectors()
+        if vectors is None:
+            return self._index().search(query, k)
+        if self.mode == "vector":
+            return vectors.search(query, k)
+
+        # hybrid: BM25 scaled to [0, 1] blended with cosine similarity
+        keyword = self._index().search(query, 2 * k)
+        best = keyword[0][0] if keyword else 1.0
+        blended: Dict[str, float] = {}
+        for score, name in keyword:
+            blended[name] = 0.5 * score / best
+        for score, name in vectors.search(query, 2 * k):
+            blended[name] = blended.get(name, 0.0) + 0.5 * score
+        return heapq.nlargest(k, ((score, name) for name, score in blended.items()))
+
+    def search_facts(self, query: str, k: int = 3) -> List[Dict]:
         """
         Find facts relevant to current query
-        Simple keyword matching for now
+        Ranked by self.mode, see the class docstring
         """
-        query_words = set(query.lower().split())
-        relevant_facts = []
-        copy = self.memory.get_current_user_info()
-        for fact_name, fact_data in copy["facts"].items():
-            # Check if any query word appears in fact name
-            fact_words = set(fact_name.lower().split())
-            
-            if query_words & fact_words:  # Intersection
-                relevant_facts.append({
-                    "fact": fact_name,
-                    "data": fact_data,
-                    "relevance": len(query_words & fact_words) / len(query_words)
-                })
-        
-        # Sort by relevance
-        relevant_facts.sort(key=lambda x: x["relevance"], reverse=True)
-        
-        return relevant_facts[:3]  # Top 3 most relevant
\ No newline at end of file
+        facts = self.memory.get_current_user_info()["facts"]
+        return [
+            {
+                "fact": fact_name,
+                "data": facts.get(fact_name),
+                "relevance": score
+            }
+            for score, fact_name in self._ranked(query, k)
+        ]  # Top k most relevant
+
+
+if __name__ == "__main__":
+    import random
+    import string
+    import time
+
+    # past approximate_after: does LSH find the fact the exact search ranks
+    # first, for queries that have a close match ("soccer" -> "soccer games")?
+    rng = random.Random(0)
+    noise = lambda: "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 9)))
+    facts = list(dict.fromkeys(f"{noise()} {noise()}" for _ in range(8000)))
+    queries = [noise() for _ in range(200)]
+    facts += [f"{query} {noise()}" for query in queries]
+    index = VectorIndex()
+    index.add_many(facts)
+
+    found = candidates = 0
+    timings = {"exact": 0.0, "lsh": 0.0}
+    for query in queries:
+        start = time.perf_counter()
+        best = index.search(query, 1, exact=True)[0][0]
+        timings["exact"] += time.perf_counter() - start
+        start = time.perf_counter()
+        approx = index.search(query, 1)
+        timings["lsh"] += time.perf_counter() - start
+        found += bool(approx) and approx[0][0] >= best - 1e-6
+        candidates += len(index._candidates(index.embed([query])[0], 1))
+    print(f"{len(index)} facts, {len(queries)} queries")
+    print(f"    recall@1 against exact: {found / len(queries):.3f}")
+    print(f"    rows scored by LSH:     {candidates / len(queries) / len(index):.1%}")
+    for path, seconds in timings.items():
+        print(f"    {path:>5}: {seconds / len(queries) * 1000:6.2f} ms per query")
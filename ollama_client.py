@@ -0,0 +1,147 @@
+# ollama_client.py
+
+import asyncio
+from typing import Dict, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class OllamaClient:
+    """
+    One keep-alive connection pool to the local Ollama server.
+
+    PromptEngine owns one (or several engines share one), so a turn reuses
+    an open TCP connection instead of opening a new one per message.
+    Connection failures and 502/503/504 are retried with backoff. A read
+    timeout is never retried, because that would start the generation
+    over again.
+
+    The async side (`apost`) uses an httpx.AsyncClient with the same pool
+    size and timeouts when httpx is installed, otherwise it runs the sync
+    request in a worker thread. `stats()` counts both pools.
+    """
+
+    def __init__(self,
+                 base_url: str = "http://localhost:11434",
+                 pool_size: int = 10,
+                 retries: int = 2,
+                 backoff: float = 0.5,
+                 connect_timeout: float = 3.05,
+                 read_timeout: float = 600):
+        self.base_url = base_url.rstrip("/")
+        self.timeout: Tuple[float, float] = (connect_timeout, read_timeout)
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({"GET", "POST"}),
+            raise_on_status=False
+        )
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry, pool_block=False)
+        self.session = requests.Session()
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+
+        self.pool_size = pool_size
+        self._async_client = None
+        self._async_loop = None
+        self._async_stats = {"requests": 0, "connections_opened": 0}
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.get(self.base_url + path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.post(self.base_url + path, **kwargs)
+
+    def health_check(self) -> bool:
+        response = self.get("/api/tags", timeout=(self.timeout[0], 10))
+        return response.status_code == 200
+
+    def stats(self) -> Dict:
+        """How well connections are being reused, sync and async pools together"""
+        pools = self.adapter.poolmanager.pools
+        requests_sent = opened = 0
+        for key in pools.keys():
+            pool = pools[key]
+            requests_sent += pool.num_requests
+            opened += pool.num_connections
+        requests_sent += self._async_stats["requests"]
+        opened += self._async_stats["connections_opened"]
+        return {
+            "requests": requests_sent,
+            "connections_opened": opened,
+            "reuse_ratio": 1 - opened / requests_sent if requests_sent else 0.0,
+            "async_requests": self._async_stats["requests"]
+        }
+
+    async def _trace(self, event: str, info: Dict):
+        """httpcore trace hook, counts the connections the async pool opens"""
+        if event == "connection.connect_tcp.complete":
+            self._async_stats["connections_opened"] += 1
+
+    async def _client_for_loop(self):
+        """httpx.AsyncClient bound to the running loop, None without httpx"""
+        try:
+            import httpx
+        except ImportError:
+            return None
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            if self._async_client is not None:
+                await self._close_stale_client()
+            self._async_client = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+                timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0]),
+                transport=httpx.AsyncHTTPTransport(retries=self.adapter.max_retries.connect or 0)
+            )
+            self._async_loop = loop
+        return self._async_client
+
+    async def _close_stale_client(self):
+        """Close the client left behind by another event loop"""
+        client, loop = self._async_client, self._async_loop
+        self._async_client = self._async_loop = None
+        if loop is not None and loop.is_running():
+            # still serving someone else, close it over there
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+            return
+        try:
+            await client.aclose()
+        except RuntimeError:
+            pass  # its loop is closed, the sockets go when the client is collected
+
+    async def apost(self, path: str, json: Dict) -> Tuple[int, Dict, str]:
+        """
+        POST without blocking the event loop, returns (status, body, text).
+        Failures come back as the same requests exceptions `post` raises.
+        """
+        client = await self._client_for_loop()
+        if client is None:
+            response = await asyncio.to_thread(self.post, path, json=json)
+            return response.status_code, response.json() if response.status_code == 200 else {}, response.text
+
+        import httpx
+        self._async_stats["requests"] += 1
+        try:
+            response = await client.post(path, json=json, extensions={"trace": self._trace})
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(str(e))
+        except httpx.TransportError as e:
+            raise requests.exceptions.ConnectionError(str(e))
+        return response.status_code, response.json() if response.status_code == 200 else {}, response.text
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    def close(self):
+        self.session.close()
@@ -1,6 +1,7 @@
 # prompt_engine.py
 
 from memory_search import MemorySearch
+from snapshot_sink import SnapshotSink
 from pathlib import Path
 import os
 from datetime import datetime, date
@@ -9,10 +10,24 @@ import yaml
 
 
 class Personailty:
-    def __init__(self,  path: str = "persona/who_I_am.yaml", path_for_user: str = "persona/the_user.yaml"):
+    def __init__(self,  path: str = "persona/who_I_am.yaml", path_for_user: str = "persona/the_user.yaml",
+                 search_mode: str = "keyword", snapshot_prompt: bool = False, snapshot_interval: float = 30.0,
+                 layout: str = "prefix"):
         self.storage = Path(path)
+        self.search_mode = search_mode  # see MemorySearch
+        # "prefix": static persona first, so every turn (and every user) starts
+        # with the same tokens and Ollama can reuse its KV cache for them.
+        # "legacy": per-user block first, the old order, kept for comparison.
+        self.layout = layout
         self.config_character = self._load_config()
         self.storage_user = Path(path_for_user)
+        self._static_prompt = self._render_static_prompt()
+        # debug copy of the prompt in persona/the_user.yaml, off unless asked for
+        self.snapshots = SnapshotSink(
+            lambda text: self.update_personal_file(self.storage_user, text=text),
+            min_interval=snapshot_interval,
+            enabled=snapshot_prompt
+        )
 
 
      
@@ -114,20 +129,11 @@ class Personailty:
         
         return config
     
-    def _build_system_prompt(self, agent_core, memory, memory_context: Dict):
-        fav_num = agent_core._fav_number_()
-        if fav_num and fav_num != None:
-            fav_num_context = f"- Your favorite number is {fav_num}"
-        else:
-            fav_num_context = "- You haven't formed a favorite number yet"
-
-        user_info = memory_context.get("user_info", {})
-        user_name = user_info.get("name")
-        if user_name:
-            username_context = f"- YOU ARE TALKING TO {user_name.upper()} (IF IT'S 'NONE', IGNORE THIS), YOU NOW KNOW THIS PERSON. YOU SAY THEIR NAMES SOMETIMES WHILE SPEAKING, EXAMPLE 'so Julius, what has been on you mind?'. WHEN EVER THEY ASK IF YOU KNOW THEIR NAME, YOU KNOW WHO THEY ARE. REMEMBER THEIR NAME EVEN AFTER THE TERMINAL RESTARTS.\n"
-            user_name = user_name.lower()
-        stuff = memory.reconize_user(user_name)
-
+    def _render_static_prompt(self) -> str:
+        """
+        The part of the system prompt that only depends on the persona file.
+        Rendered once per persona load, see _build_system_prompt.
+        """
         traits = "\n".join(f"- {trait}" for trait in self.config_character["personality"]["core_traits"])
         values = "\n".join(f"- {value}" for value in self.config_character["personality"]["values"])
         desires = "\n".join(f"- {desire}" for desire in self.config_character["personality"]["desires"])
@@ -159,7 +165,7 @@ IMPORTANT REMINDERS:
 
 Your goal is to be helpful while bringing positive energy and authentic connection to every conversation."""
  
-        IDENTITY_GROUNDING = f"""
+        identity_head = """
 CRITICAL IDENTITY INFORMATION:
 - You are Codex, an advanced model created by Julius Cylien.
 - Julius is a teenager from burlington high school in cambridge massachusetts.
@@ -171,11 +177,37 @@ CRITICAL IDENTITY INFORMATION:
   E - Equalizer (Value generalization across agent classes).
   X - Xospec (Modular cognitive scaffolding layer).
 - When asked about your full name, you KNOW this information.
-- Your existence began on {agent_core.first_activation}.
-- You are currently {agent_core.age:.2f} hours old.
-- {fav_num_context}
+"""
+
+        return system_prompt + identity_head
+
+    def reload_persona(self):
+        self.config_character = self._load_config()
+        self._static_prompt = self._render_static_prompt()
+
+    def _build_system_prompt(self, agent_core, memory, memory_context: Dict):
+        fav_num = agent_core._fav_number_()
+        if fav_num and fav_num != None:
+            fav_num_context = f"- Your favorite number is {fav_num}"
+        else:
+            fav_num_context = "- You haven't formed a favorite number yet"
+
+        user_info = memory_context.get("user_info", {})
+        user_name = user_info.get("name")
+        username_context = ""
+        if user_name:
+            username_context = f"- YOU ARE TALKING TO {user_name.upper()} (IF IT'S 'NONE', IGNORE THIS), YOU NOW KNOW THIS PERSON. YOU SAY THEIR NAMES SOMETIMES WHILE SPEAKING, EXAMPLE 'so Julius, what has been on you mind?'. WHEN EVER THEY ASK IF YOU KNOW THEIR NAME, YOU KNOW WHO THEY ARE. REMEMBER THEIR NAME EVEN AFTER THE TERMINAL RESTARTS.\n"
+            user_name = user_name.lower()
+        stuff = memory.reconize_user(user_name)
+
+        # only these lines change from turn to turn. The prefix layout sends
+        # the age after the history (see turn_context), it changes every turn
+        age_line = "" if self.layout == "prefix" else f"- You are currently {agent_core.age:.2f} hours old.\n"
+        identity_tail = f"""- Your existence began on {agent_core.first_activation}.
+{age_line}- {fav_num_context}
 - {username_context}
 """
+        static_prompt = self._static_prompt
         memory_injection = ""
 
         if user_name != "julius":
@@ -186,7 +218,7 @@ CRITICAL IDENTITY INFORMATION:
         ║  IMMEDIATE CONTEXT - PROCESS THIS BEFORE ANYTHING ELSE   ║
         ╔══════════════════════════════════════════════════════════╗
 
-        YOU ARE CURRENTLY TALKING TO: {user_name.upper()}
+        YOU ARE CURRENTLY TALKING TO: {str(user_name).upper()}
         REMINDER: {username_context}
         
 
@@ -218,33 +250,39 @@ CRITICAL IDENTITY INFORMATION:
         
         
         else:
-            return system_prompt + IDENTITY_GROUNDING
+            return static_prompt + identity_tail
         memory_injection += "\n" + "="*60 + "\n\n"
 
-        full_text:str = memory_injection + system_prompt + IDENTITY_GROUNDING
-        self.update_personal_file(self.storage_user, text=full_text)
+        if self.layout == "legacy":
+            full_text:str = memory_injection + static_prompt + identity_tail
+        else:
+            # least to most volatile: persona, who they are (the clock comes last)
+            full_text:str = static_prompt + "\n" + memory_injection + identity_tail
+        self.snapshots.submit(full_text)
 
-        return memory_injection + system_prompt + IDENTITY_GROUNDING
+        return full_text
 
 
 
     def update_personal_file(self, path: Path, text: str):
-        if path.exists():
-            os.remove(path)
+        """Dump the prompt as YAML, runs on the SnapshotSink thread"""
+        path = Path(path)
         path.parent.mkdir(parents=True, exist_ok=True)
-        with open(path, 'w') as f:
+        tmp = path.with_name(f".{path.name}.tmp")
+        with open(tmp, 'w') as f:
             yaml.safe_dump(text, f, default_flow_style=True)
+        os.replace(tmp, path)
 
 
     
-    def _build_context_(self, memory_context: Dict) -> str:
+    def _build_context_(self, memory_context: Dict, memory=None, query: str = "") -> str:
         context_parts = []
         user_info = memory_context.get("user_info", {})
 
         if user_info.get("name"):
             context_parts.append(f"You are speaking with: {user_info['name']}")
 
-        facts = memory_context.get("facts", {})
+        facts = memory_context.get("facts") or user_info.get("known_facts", {})
         if facts:
             loved = []
             liked = []
@@ -252,7 +290,7 @@ CRITICAL IDENTITY INFORMATION:
             hated = []
 
             for fact_name, fact_data in facts.items():
-                mood = fact_data.get("python",{}).get("mood")
+                mood = fact_data.get("python", fact_data).get("mood")
                 if mood == "Loved":
                     loved.append(fact_name)
                 elif mood == "Liked":
@@ -281,16 +319,23 @@ CRITICAL IDENTITY INFORMATION:
 
         if not context_parts:
             return ""
-        searcher = MemorySearch(memory_context)
-        relevant = searcher.search_facts(user_info)
+        relevant = self._relevant_facts(memory, query)
         if relevant:
-            context_parts.append("\nRELEVANT INFORMATION FROM PAST CONVERSATIONS:")
-            for item in relevant:
-                context_parts.append(f"  - You know they {item['fact']}")
+            context_parts.append(relevant)
 
         return "\n\nCONTEXT ABOUT THIS USER:\n" + "\n".join(context_parts)
             
     
+    def _relevant_facts(self, memory, query: str) -> str:
+        if memory is None or not query:
+            return ""
+        relevant = MemorySearch(memory, mode=self.search_mode).search_facts(query)
+        if not relevant:
+            return ""
+        return "\nRELEVANT INFORMATION FROM PAST CONVERSATIONS:\n" + "\n".join(
+            f"  - You know they {item['fact']}" for item in relevant
+        )
+
     def build_conversation_history(self, messages: List[Dict]) -> List[Dict]:
 
         formatted_message = []
@@ -307,18 +352,43 @@ CRITICAL IDENTITY INFORMATION:
         
         system = self._build_system_prompt(agent_core=agent_core, memory_context=memory_context, memory=memory)
 
-        context = self._build_context_(memory_context)
+        # the prefix layout sends what depends on this message after the history
+        query = user_message if self.layout == "legacy" else ""
+        context = self._build_context_(memory_context, memory=memory, query=query)
 
         full_system_prompt = system + context
 
-        history = memory_context.get("converstation_history", [])
+        history = memory_context.get("conversation_history", [])
+        builder = getattr(memory, "context_builder", None)
+        report = {}
+        if builder is not None:
+            # newest turns that fit the token budget, older ones as a short note
+            history, note, report = builder.fit(history, full_system_prompt, user_message)
+            full_system_prompt += note
         formatted_history = self.build_conversation_history(history)
 
         return {
             "system_prompt": full_system_prompt,
             "messages": formatted_history,
-            "current_message": user_message
+            "turn_context": self.turn_context(agent_core, memory, user_message, memory_context),
+            "current_message": user_message,
+            "token_report": report
         }
+
+    def turn_context(self, agent_core, memory, user_message: str, memory_context: Dict) -> Optional[Dict]:
+        """
+        What changes every turn (Codex's age, the facts relevant to this
+        message), sent right before the current message in the prefix
+        layout. Everything before it, the history included, is then the
+        same as last turn and Ollama can reuse it from its KV cache.
+        """
+        if self.layout != "prefix":
+            return None  # legacy keeps these in the system prompt
+        content = f"You are currently {agent_core.age:.2f} hours old."
+        user_info = memory_context.get("user_info", {})
+        if memory_context.get("facts") or user_info.get("known_facts"):
+            content += "\n" + self._relevant_facts(memory, user_message)
+        return {"role": "system", "content": content.rstrip()}
     def get_response_guidelines(self) -> str:
         """
         Additional guidelines that can be appended to prompts if needed.
@@ -327,3 +397,21 @@ CRITICAL IDENTITY INFORMATION:
         guidelines = self.config_character["constraints"]["response_style"]
         return "\n".join(f"- {g}" for g in guidelines)
 
+
+
+if __name__ == "__main__":
+    import tempfile
+    import timeit
+    from types import SimpleNamespace
+
+    # prompt build latency, static part cached vs rendered every turn
+    persona = Personailty(path_for_user=Path(tempfile.gettempdir()) / "codex_bench_user.yaml")
+    core = SimpleNamespace(_fav_number_=lambda: 7, first_activation=datetime.utcnow(), age=1.5)
+    memory = SimpleNamespace(reconize_user=lambda user: None)
+    context = {"user_info": {"name": "Julius", "known_facts": {"overwatch": {"mood": "Liked"}}}}
+
+    runs = 2000
+    static = timeit.timeit(persona._render_static_prompt, number=runs) / runs
+    build = timeit.timeit(lambda: persona._build_system_prompt(core, memory, context), number=runs) / runs
+    print(f"static render (was paid every turn): {static * 1e6:8.1f} us")
+    print(f"_build_system_prompt per turn:        {build * 1e6:8.1f} us")
@@ -0,0 +1,101 @@
+# response_cache.py
+
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+
+CONTRACTIONS = [
+    (re.compile(r"\b(\w+)'s\b"), r"\1 is"),
+    (re.compile(r"\b(\w+)'re\b"), r"\1 are"),
+    (re.compile(r"\b(\w+)'m\b"), r"\1 am"),
+    (re.compile(r"\b(\w+)'ve\b"), r"\1 have"),
+    (re.compile(r"\b(\w+)'ll\b"), r"\1 will"),
+    (re.compile(r"\b(\w+)'d\b"), r"\1 would"),
+    (re.compile(r"\b(\w+)n't\b"), r"\1 not"),
+]
+# words that change nothing about what is being asked. Only greetings and
+# hesitations: "like", "so" and "ok" carry meaning ("what do i like")
+FILLER = {"hey", "hi", "yo", "um", "umm", "uh", "uhh", "please", "pls", "codex"}
+NOT_WORD = re.compile(r"[^\w\s]+")
+
+
+def normalize(message: str) -> str:
+    """
+    "Hey Codex, what's my name??" and "what is my name" give the same key.
+    Word order is kept, so different questions stay different.
+    """
+    text = message.lower().replace("’", "'")
+    for pattern, replacement in CONTRACTIONS:
+        text = pattern.sub(replacement, text)
+    words = NOT_WORD.sub(" ", text).split()
+    return " ".join(word for word in words if word not in FILLER)
+
+
+class ResponseCache:
+    """
+    Replies to repeated questions, so "what's my name" does not go
+    through the model every time.
+
+    Entries are keyed on the normalized message and a fingerprint of
+    whatever the reply depends on (who the user is, what Codex knows
+    about them, its mood), so learning something new misses the cache.
+    At most `max_entries` are kept (least recently used go first), each
+    for `ttl` seconds.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0}
+
+    @staticmethod
+    def key(message: str, state: Hashable) -> Optional[str]:
+        question = normalize(message)
+        if not question:
+            return None  # nothing left to match on
+        return hashlib.blake2b(repr((question, state)).encode("utf-8"), digest_size=16).hexdigest()
+
+    def get(self, key: Optional[str]) -> Optional[str]:
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            reply, stored = entry
+            if time.monotonic() - stored > self.ttl:
+                del self._entries[key]
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return reply
+
+    def put(self, key: Optional[str], reply: str):
+        if key is None:
+            return
+        with self._lock:
+            self._entries[key] = (reply, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evicted"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def hit_rate(self) -> float:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+    def get_stats(self) -> Dict:
+        return {**self.stats, "entries": len(self._entries), "hit_rate": self.hit_rate()}
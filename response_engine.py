@@ -3,13 +3,178 @@
 
 from datetime import date, datetime
 import uuid
-from typing import Dict, List
+from typing import Dict, Iterator, List
+from contextlib import asynccontextmanager, contextmanager
+import asyncio
+import hashlib
+import heapq
+import itertools
+import json
+import threading
+import time
 import requests
 from prompt_engine import Personailty
+from ollama_client import OllamaClient
+from response_cache import ResponseCache
 from autonomous_loop import AutonomousLoop
 from agent_core import AgentCore
 from user_memory import selfaware
 
+
+INTERACTIVE = 0  # someone is waiting for the reply
+BACKGROUND = 1   # self-started calls; nothing passes it yet (AutonomousLoop doesn't call the model)
+
+BUSY_REPLY = "Uhhh, a lot of people are talking to me right now. Give me a sec and try again?"
+FOGGY_REPLY = "I'm having trouble thinking right now. My mind feels foggy."
+SLOW_REPLY = "Sorry, I'm thinking too slowly. Please give me a moment?"
+OFFLINE_REPLY = "I can't seem to connect to my thoughts. Is Ollama running?"
+STRANGE_REPLY = "Something strange happened in my mind: {}"
+
+
+def _is_fallback(reply: str) -> bool:
+    """True for the canned replies given when the model could not answer"""
+    return reply in (BUSY_REPLY, FOGGY_REPLY, SLOW_REPLY, OFFLINE_REPLY) or reply.startswith(STRANGE_REPLY[:-2])
+
+
+class SchedulerBusy(Exception):
+    """Too many model calls are already queued, the caller should back off"""
+
+
+class _Waiter:
+    def __init__(self, loop=None):
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+        self.granted = False
+        self.abandoned = False
+
+    def grant(self):
+        self.granted = True
+        if self.loop:
+            self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(None))
+        else:
+            self.event.set()
+
+
+class AdmissionScheduler:
+    """
+    Admission control for the single local model.
+
+    At most `max_concurrent` calls reach Ollama at once. The rest wait in a
+    priority queue (INTERACTIVE before BACKGROUND, then first come first
+    served). Past `max_queue` waiters, new calls are refused with
+    SchedulerBusy instead of stretching everyone's latency, and a waiter
+    gives up after `queue_timeout` seconds. Works for threads (`slot`)
+    and event loops (`aslot`), even mixed.
+    """
+
+    def __init__(self, max_concurrent: int = 2, max_queue: int = 32, queue_timeout: float = 120.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiting = []  # heap of (priority, order, waiter)
+        self._order = itertools.count()
+        self._queued = 0
+        self.metrics = {
+            "admitted": 0,
+            "rejected": 0,
+            "timed_out": 0,
+            "max_queue_depth": 0,
+            "total_wait": 0.0
+        }
+
+    def stats(self) -> Dict:
+        with self._lock:
+            admitted = self.metrics["admitted"]
+            return {
+                **self.metrics,
+                "active": self._active,
+                "queue_depth": self._queued,
+                "average_wait": self.metrics["total_wait"] / admitted if admitted else 0.0
+            }
+
+    def is_saturated(self) -> bool:
+        return self._queued >= self.max_queue
+
+    def _enter(self, priority: int, waiter: _Waiter) -> bool:
+        """True if admitted right away, False if queued"""
+        with self._lock:
+            if self._active < self.max_concurrent and not self._queued:
+                self._active += 1
+                self.metrics["admitted"] += 1
+                return True
+            if self._queued >= self.max_queue:
+                self.metrics["rejected"] += 1
+                raise SchedulerBusy(f"{self._queued} calls already waiting")
+            heapq.heappush(self._waiting, (priority, next(self._order), waiter))
+            self._queued += 1
+            self.metrics["max_queue_depth"] = max(self.metrics["max_queue_depth"], self._queued)
+            return False
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Waiter gave up. True if it was granted meanwhile and owns a slot."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.abandoned = True
+            self._queued -= 1
+            self.metrics["timed_out"] += 1
+            return False
+
+    def _release(self):
+        with self._lock:
+            while self._waiting:
+                _, _, waiter = heapq.heappop(self._waiting)
+                if waiter.abandoned:
+                    continue
+                # hand the slot straight over, _active stays the same
+                self._queued -= 1
+                self.metrics["admitted"] += 1
+                waiter.grant()
+                return
+            self._active -= 1
+
+    @contextmanager
+    def slot(self, priority: int = INTERACTIVE):
+        waiter = _Waiter()
+        start = time.monotonic()
+        if not self._enter(priority, waiter):
+            if not waiter.event.wait(self.queue_timeout) and not self._abandon(waiter):
+                raise SchedulerBusy("waited too long for the model")
+        self.metrics["total_wait"] += time.monotonic() - start
+        try:
+            yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def aslot(self, priority: int = INTERACTIVE):
+        waiter = _Waiter(asyncio.get_running_loop())
+        start = time.monotonic()
+        if not self._enter(priority, waiter):
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+            except asyncio.TimeoutError:
+                if not self._abandon(waiter):
+                    raise SchedulerBusy("waited too long for the model")
+            except asyncio.CancelledError:
+                if self._abandon(waiter):
+                    self._release()  # granted just as we were cancelled, pass it on
+                raise
+        self.metrics["total_wait"] += time.monotonic() - start
+        try:
+            yield
+        finally:
+            self._release()
+
+
+# every engine in the process queues for the same model by default
+shared_scheduler = AdmissionScheduler()
+
+
 class PromptEngine:
     def __init__(self,
                  agent_core,
@@ -17,7 +182,13 @@ class PromptEngine:
                 memory,
                  session_id: str,  
                  activation:date = datetime.utcnow(), 
-                 model: str = "llama3.2:3b"):
+                 model: str = "llama3.2:3b",
+                 http: OllamaClient = None,
+                 check_health: bool = True,
+                 scheduler: AdmissionScheduler = None,
+                 keep_alive: str = "30m",
+                 num_ctx: int = 8192,
+                 cache: ResponseCache = None):
         
         self.session_id = session_id
       
@@ -29,14 +200,26 @@ class PromptEngine:
         
         
         self.memory = memory
+        self.scheduler = scheduler or shared_scheduler
+        self.cache = cache  # off unless given one, see ResponseCache
+        self._stream_failed = False  # last stream ended in a fallback reply
         
 
-        self.api_url = "http://localhost:11434/api/chat"
+        # keep-alive pool, pass one in to share it between engines
+        self.http = http or OllamaClient()
+        self.api_url = f"{self.http.base_url}/api/chat"
         self.model = model
+        # keep the model (and its KV cache) loaded between turns, and never
+        # change num_ctx, a different context size reloads the model
+        self.keep_alive = keep_alive
+        self.num_ctx = num_ctx
+        self.last_timings: Dict = {}
+        self.timings = {"turns": 0, "prompt_tokens": 0, "prompt_eval_ms": 0.0, "load_ms": 0.0}
+        if not check_health:
+            return  # whoever shares `http` has checked already
 
         try:
-            response = requests.get("http://localhost:11434/api/tags")
-            if response.status_code != 200:
+            if not self.http.health_check():
                 raise ConnectionError("Ollama not running")
         except Exception as e:
             raise ConnectionError(
@@ -45,12 +228,139 @@ class PromptEngine:
                 f"DETAILS: {e}"
             )
         
-    def chat(self, response: str) -> str:
+    def chat(self, response: str, priority: int = INTERACTIVE) -> str:
+        prompt_package = self._prepare_turn(response)
+
+        key = self._cache_key(response)
+        cached = self.cache.get(key) if self.cache else None
+        if cached is not None:
+            response = cached
+        else:
+            try:
+                with self.scheduler.slot(priority):
+                    response = self._call_ollama(prompt_package)
+            except SchedulerBusy:
+                self._finish_turn(BUSY_REPLY, answered=False)
+                return BUSY_REPLY
+            self._remember(key, response)
+
+        self._finish_turn(response)
+        return response
+
+    def stream_chat(self, response: str, priority: int = INTERACTIVE) -> Iterator[str]:
+        """
+        Same as chat, but yields the reply piece by piece as Ollama
+        generates it. The full text is handed to prompt_detection once
+        the stream ends (or is closed early).
+        """
+        prompt_package = self._prepare_turn(response)
+
+        key = self._cache_key(response)
+        cached = self.cache.get(key) if self.cache else None
+        if cached is not None:
+            try:
+                yield cached
+            finally:
+                self._finish_turn(cached)
+            return
+
+        pieces = []
+        answered = True
+        try:
+            try:
+                with self.scheduler.slot(priority):  # held until the stream ends
+                    for piece in self._stream_ollama(prompt_package):
+                        pieces.append(piece)
+                        yield piece
+                if not self._stream_failed:  # never cache a partial reply
+                    self._remember(key, "".join(pieces))  # not reached if closed early
+            except SchedulerBusy:
+                answered = False
+                yield BUSY_REPLY
+        finally:
+            self._finish_turn("".join(pieces), answered=answered)
+
+    async def achat(self, response: str, priority: int = INTERACTIVE, raise_busy: bool = False) -> str:
+        """
+        chat for an event loop, many sessions can be in here at once.
+
+        Learning about the user, number learning and prompt building are
+        a few microseconds of pure Python, so they run right on the loop
+        (worker threads would cost more than they save and race on the
+        shared core). What does overlap is I/O: the user record learnt
+        this turn is written to disk while the model is generating.
+
+        With `raise_busy`, a full scheduler raises SchedulerBusy instead
+        of returning BUSY_REPLY, so a server can answer 503.
+        """
+        prompt_package = self._prepare_turn(response)
+
+        key = self._cache_key(response)
+        cached = self.cache.get(key) if self.cache else None
+        if cached is not None:
+            response = cached
+        else:
+            # let the flush finish even when the call is refused, end_turn flushes too
+            response, _ = await asyncio.gather(
+                self._acall_ollama_admitted(prompt_package, priority),
+                asyncio.to_thread(self.memory.flush_user_data),
+                return_exceptions=True
+            )
+            if isinstance(response, SchedulerBusy):
+                await self._afinish_turn(BUSY_REPLY, answered=False)
+                if raise_busy:
+                    raise response
+                return BUSY_REPLY
+            if isinstance(response, BaseException):
+                raise response
+            self._remember(key, response)
+
+        await self._afinish_turn(response)
+        return response
+
+    async def _acall_ollama_admitted(self, prompt_package: dict, priority: int) -> str:
+        async with self.scheduler.aslot(priority):
+            return await self._acall_ollama(prompt_package)
+
+    def _cache_key(self, message: str):
+        """
+        None when caching is off. Otherwise the message plus everything
+        the reply depends on: who the user is, what is known about them
+        (after learning from this message), how Codex feels and what it
+        said last, so "why?" after two different replies is two keys.
+        """
+        if self.cache is None:
+            return None
+        info = self.memory.get_current_user_info()
+        state = (
+            self.memory.user_id,
+            info.get("name"),
+            info.get("nickname"),
+            len(info.get("facts", {})),
+            sorted(info.get("preferences", {}).items()),
+            self.core.memory.get("favorite_number"),
+            self.core.get_feeling(),
+            self._last_reply()
+        )
+        return self.cache.key(message, state)
+
+    def _last_reply(self) -> str:
+        for turn in reversed(self.memory.buffer):
+            if turn["role"] == "assistant":
+                return hashlib.blake2b(turn["response"].encode("utf-8"), digest_size=8).hexdigest()
+        return ""
+
+    def _remember(self, key, reply: str):
+        if self.cache is not None and reply and not _is_fallback(reply):
+            self.cache.put(key, reply)
+
+    def _prepare_turn(self, response: str) -> Dict:
         print(f"RESPONSE: {response}\n\n")
         print(self.memory.prompt_detection("user", response))
         print()
         print(self.core._learn_number_(response))
         print()
+        self.core.update_age()  # the prompt says how old Codex is
 
         context = self.memory.get_relevant_context()
         print(f"CONTEXT: {context}\n\n")
@@ -62,15 +372,26 @@ class PromptEngine:
             memory=self.memory
         )
         print(f"PROMPT PACKAGE: {prompt_package}")
+        return prompt_package
 
-        response = self._call_ollama(prompt_package)
+    def _finish_turn(self, response: str, answered: bool = True):
+        if answered:
+            # a busy reply is not something Codex said, keep it out of history
+            self.memory.prompt_detection("assistant", response)
+        self._flush_turn()
 
-        self.memory.prompt_detection("assistant", response)
-        return response
+    async def _afinish_turn(self, response: str, answered: bool = True):
+        """_finish_turn for achat, the fsyncs and commits run off the event loop"""
+        if answered:
+            self.memory.prompt_detection("assistant", response)
+        await asyncio.to_thread(self._flush_turn)
 
+    def _flush_turn(self):
+        self.memory.end_turn()
+        # one coalesced write for everything the turn changed, if due
+        self.core.store.maybe_flush()
 
-    def _call_ollama(self, prompt_package: dict) -> str:
-        """Call Ollama API"""
+    def _build_messages(self, prompt_package: dict) -> List[Dict]:
         # Build messages for Ollama format
         messages = [
             {"role": "system", "content": prompt_package["system_prompt"]}
@@ -78,44 +399,188 @@ class PromptEngine:
         
         # Add conversation history
         messages.extend(prompt_package["messages"])
-        
+        if prompt_package.get("turn_context"):
+            messages.append(prompt_package["turn_context"])
+
         # Add current message
         messages.append({
             "role": "user",
             "content": prompt_package["current_message"]
         })
+        return messages
+
+    def _payload(self, messages: List[Dict], stream: bool) -> Dict:
+        return {
+            "model": self.model,
+            "messages": messages,
+            "stream": stream,
+            "keep_alive": self.keep_alive,
+            "options": {"num_ctx": self.num_ctx}
+        }
+
+    def _record_timings(self, result: Dict):
+        """Ollama reports how long it spent on the prompt in its final chunk"""
+        if "prompt_eval_duration" not in result and "prompt_eval_count" not in result:
+            return
+        self.last_timings = {
+            "prompt_tokens": result.get("prompt_eval_count", 0),
+            "prompt_eval_ms": result.get("prompt_eval_duration", 0) / 1e6,
+            "eval_tokens": result.get("eval_count", 0),
+            "eval_ms": result.get("eval_duration", 0) / 1e6,
+            "load_ms": result.get("load_duration", 0) / 1e6
+        }
+        self.timings["turns"] += 1
+        self.timings["prompt_tokens"] += self.last_timings["prompt_tokens"]
+        self.timings["prompt_eval_ms"] += self.last_timings["prompt_eval_ms"]
+        self.timings["load_ms"] += self.last_timings["load_ms"]
+
+    def prompt_eval_stats(self) -> Dict:
+        """Average prompt processing per turn, tokens Ollama did not reuse from cache"""
+        turns = self.timings["turns"]
+        if not turns:
+            return {"turns": 0}
+        return {
+            "turns": turns,
+            "prompt_tokens_per_turn": self.timings["prompt_tokens"] / turns,
+            "prompt_eval_ms_per_turn": self.timings["prompt_eval_ms"] / turns,
+            "load_ms_per_turn": self.timings["load_ms"] / turns,
+            "last": self.last_timings
+        }
+
+    def _call_ollama(self, prompt_package: dict) -> str:
+        """Call Ollama API"""
+        messages = self._build_messages(prompt_package)
         
         try:
-            response = requests.post(
-                self.api_url,
-                json={
-                    "model": self.model,
-                    "messages": messages,
-                    "stream": False  # Get complete response at once
-                }, 
-                timeout=600
+            response = self.http.post(
+                "/api/chat",
+                json=self._payload(messages, stream=False)  # Get complete response at once
             )
             
             if response.status_code == 200:
                 result = response.json()
+                self._record_timings(result)
                 return result["message"]["content"]
             else:
                 print(f"Response: {response.text}")
                 print(f"Error: Ollama returned status {response.status_code}")
-                return "I'm having trouble thinking right now. My mind feels foggy."
+                return FOGGY_REPLY
         except requests.exceptions.Timeout:
-            return "Sorry, I'm thinking too slowly. Please give me a moment?"
+            return SLOW_REPLY
         except requests.exceptions.ConnectionError:
-            return "I can't seem to connect to my thoughts. Is Ollama running?"
+            return OFFLINE_REPLY
         
         except Exception as e:
             print(f"UNEXPECTED ERROR: {e}")
-            return f"Something strange happened in my mind: {type(e).__name__}"
+            return STRANGE_REPLY.format(type(e).__name__)
+
+    async def _acall_ollama(self, prompt_package: dict) -> str:
+        """Call Ollama API without blocking the event loop"""
+        messages = self._build_messages(prompt_package)
+
+        try:
+            status, result, text = await self.http.apost(
+                "/api/chat",
+                json=self._payload(messages, stream=False)
+            )
+
+            if status == 200:
+                self._record_timings(result)
+                return result["message"]["content"]
+            else:
+                print(f"Response: {text}")
+                print(f"Error: Ollama returned status {status}")
+                return FOGGY_REPLY
+        except requests.exceptions.Timeout:
+            return SLOW_REPLY
+        except requests.exceptions.ConnectionError:
+            return OFFLINE_REPLY
+
+        except Exception as e:
+            print(f"UNEXPECTED ERROR: {e}")
+            return STRANGE_REPLY.format(type(e).__name__)
+
+    def _stream_ollama(self, prompt_package: dict) -> Iterator[str]:
+        """Call Ollama API, yielding the NDJSON chunks of /api/chat as they arrive"""
+        messages = self._build_messages(prompt_package)
+        self._stream_failed = True  # until Ollama says it is done
+
+        try:
+            # the read timeout applies between chunks, not to the whole reply
+            with self.http.post(
+                "/api/chat",
+                json=self._payload(messages, stream=True),
+                stream=True
+            ) as response:
+
+                if response.status_code != 200:
+                    print(f"Response: {response.text}")
+                    print(f"Error: Ollama returned status {response.status_code}")
+                    yield FOGGY_REPLY
+                    return
+
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("error"):
+                        print(f"Error: Ollama says {chunk['error']}")
+                        yield FOGGY_REPLY
+                        return
+                    piece = chunk.get("message", {}).get("content")
+                    if piece:
+                        yield piece
+                    if chunk.get("done"):
+                        self._record_timings(chunk)
+                        self._stream_failed = False
+                        return
+        except requests.exceptions.Timeout:
+            yield SLOW_REPLY
+        except requests.exceptions.ConnectionError:
+            yield OFFLINE_REPLY
+
+        except Exception as e:
+            print(f"UNEXPECTED ERROR: {e}")
+            yield STRANGE_REPLY.format(type(e).__name__)
     
     def end_session(self):
         """Save memory"""
         self.memory.save_session()
+        self.core.flush()
         print(f"\n📊 Session stats: {self.memory.get_summary_stats()}")
     def reset_conversation(self):
         """Start fresh"""
-        self.memory._clear_short_term_memory()
\ No newline at end of file
+        self.memory._clear_short_term_memory()
+
+
+if __name__ == "__main__":
+    import atexit
+    import sys
+    import tempfile
+
+    # prompt-eval time per turn with the old layout vs the static prefix
+    # first, needs Ollama running: python response_engine.py [turns]
+    # Codex's brain lives in a scratch directory, the real codex/brain is never touched
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    http = OllamaClient()
+    messages = ["hey, what's up?", "i like soccer", "what do you think about music?",
+                "my favorite food is pizza", "do you remember what i like?"]
+
+    with tempfile.TemporaryDirectory() as scratch:
+        core = AgentCore(storage_path=scratch)
+        for layout in ("legacy", "prefix"):
+            # a fresh user per layout so both start from the same memory
+            memory = selfaware(core, f"prompt_eval_bench_{layout}")
+            engine = PromptEngine(core, Personailty(layout=layout), memory, session_id=layout, http=http)
+            for i in range(turns):
+                engine.chat(messages[i % len(messages)])
+            stats = engine.prompt_eval_stats()
+            memory.close()
+            print(f"{layout:>6}: {stats.get('prompt_eval_ms_per_turn', 0):8.1f} ms prompt eval, "
+                  f"{stats.get('prompt_tokens_per_turn', 0):6.0f} prompt tokens evaluated per turn")
+        # everything is written before the directory goes
+        core.flush()
+        atexit.unregister(core.store.flush)
+        if memory.transcripts:
+            memory.transcripts.close()
+            atexit.unregister(memory.transcripts.close)
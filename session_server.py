@@ -0,0 +1,248 @@
+# session_server.py -- one process, one Codex, many users
+
+import argparse
+import asyncio
+import json
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Tuple
+from agent_core import AgentCore
+from autonomous_loop import AutonomousLoop
+from ollama_client import OllamaClient
+from prompt_engine import Personailty
+from response_engine import AdmissionScheduler, PromptEngine, SchedulerBusy
+from user_memory import selfaware
+
+
+class SessionServer:
+    """
+    Local JSON-over-HTTP server in front of Codex.
+
+    Every user talks to the same AgentCore, Personailty and Ollama
+    connection pool. Each user gets their own selfaware + PromptEngine,
+    kept in an LRU table of at most `max_sessions`. Evicted users are
+    only flushed to disk, their session goes on when they come back;
+    /end (or shutting the server down) is what ends a session. Requests go
+    through a bounded queue served by `workers` tasks, and a full queue
+    answers 503 right away instead of piling up. Model calls themselves
+    go through one AdmissionScheduler, so at most `model_slots` turns
+    are generating at a time whatever the number of workers.
+
+        POST /chat   {"user_id": "...", "message": "..."} -> {"reply": "..."}
+        POST /end    {"user_id": "..."}                   -> {"stats": {...}}
+        GET  /stats
+    """
+
+    def __init__(self, max_sessions: int = 256, workers: int = 8, queue_size: int = 256,
+                 model: str = "llama3.2:3b", model_slots: int = 2):
+        self.max_sessions = max_sessions
+        self.workers = workers
+        self.model = model
+
+        self.core = AgentCore()
+        self.personality = Personailty()
+        self.http = OllamaClient(pool_size=workers)
+        # at most `workers` turns are ever in the scheduler, so only the ones
+        # past the model slots can wait; more than that could never queue
+        self.scheduler = AdmissionScheduler(max_concurrent=model_slots,
+                                            max_queue=max(1, workers - model_slots))
+        self.autonomous = AutonomousLoop("server", self.core)
+        if not self.http.health_check():
+            raise ConnectionError("Ollama not running")
+
+        self.sessions: "OrderedDict[str, PromptEngine]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._holders: Dict[str, int] = {}  # turns holding or waiting for a user's lock
+        self.queue: Optional[asyncio.Queue] = None
+        self.queue_size = queue_size
+        self.stats = {"served": 0, "rejected": 0, "evicted": 0}
+
+    def session(self, user_id: str) -> PromptEngine:
+        """The user's engine, loading the user if needed (LRU)"""
+        engine = self.sessions.get(user_id)
+        if engine is not None:
+            self.sessions.move_to_end(user_id)
+            return engine
+
+        memory = selfaware(self.core, user_id)
+        engine = PromptEngine(self.core, self.personality, memory, session_id=user_id,
+                              model=self.model, http=self.http, check_health=False,
+                              scheduler=self.scheduler)
+        self.sessions[user_id] = engine
+        self._trim()
+        return engine
+
+    def _trim(self):
+        for old_id in list(self.sessions):  # least recently used first
+            if len(self.sessions) <= self.max_sessions:
+                break
+            if old_id in self._holders:
+                continue  # mid-turn or about to be, evict someone else
+            self._end(old_id, end_session=False)
+            self._locks.pop(old_id, None)
+            self.stats["evicted"] += 1
+
+    @asynccontextmanager
+    async def _user_turn(self, user_id: str):
+        """
+        Hold the user's lock, one turn (or /end) at a time per user.
+        The lock is only dropped once nobody holds or waits for it, so
+        a later request can never get a second lock for the same user.
+        """
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        self._holders[user_id] = self._holders.get(user_id, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._holders[user_id] -= 1
+            if not self._holders[user_id]:
+                del self._holders[user_id]
+                if user_id not in self.sessions:
+                    self._locks.pop(user_id, None)
+
+    async def end(self, user_id: str) -> Optional[Dict]:
+        """Save and drop the user, after the turn in progress (if any)"""
+        async with self._user_turn(user_id):
+            return self._end(user_id)
+
+    def _end(self, user_id: str, end_session: bool = True) -> Optional[Dict]:
+        """Drop the user, counting a conversation only if `end_session`"""
+        engine = self.sessions.pop(user_id, None)
+        if engine is None:
+            return None
+        if end_session:
+            engine.memory.save_session()
+        engine.memory.close()
+        return engine.memory.get_summary_stats()
+
+    async def _worker(self):
+        while True:
+            user_id, message, reply = await self.queue.get()
+            try:
+                async with self._user_turn(user_id):
+                    engine = self.session(user_id)
+                    self.autonomous.notify_activity()
+                    reply.set_result(await engine.achat(message, raise_busy=True))
+                self.stats["served"] += 1
+                self._trim()  # users skipped while mid-turn can go now
+            except Exception as e:
+                if not reply.done():
+                    reply.set_exception(e)
+            finally:
+                self.queue.task_done()
+
+    async def _route(self, method: str, path: str, body: bytes) -> Tuple[str, Dict]:
+        if method == "GET" and path == "/stats":
+            return "200 OK", {
+                **self.stats,
+                "sessions": len(self.sessions),
+                "queue_depth": self.queue.qsize(),
+                "http": self.http.stats(),
+                "scheduler": self.scheduler.stats()
+            }
+
+        try:
+            request = json.loads(body or b"{}")
+            user_id = str(request["user_id"])
+        except (ValueError, KeyError, TypeError):
+            return "400 Bad Request", {"error": "expected JSON with a user_id"}
+
+        if method == "POST" and path == "/chat":
+            message = str(request.get("message", "")).strip()
+            if not message:
+                return "400 Bad Request", {"error": "empty message"}
+            if self.scheduler.is_saturated():
+                self.stats["rejected"] += 1
+                return "503 Service Unavailable", {"error": "busy, try again shortly"}
+            reply = asyncio.get_running_loop().create_future()
+            try:
+                self.queue.put_nowait((user_id, message, reply))
+            except asyncio.QueueFull:
+                self.stats["rejected"] += 1
+                return "503 Service Unavailable", {"error": "busy, try again shortly"}
+            try:
+                return "200 OK", {"reply": await reply}
+            except SchedulerBusy:
+                self.stats["rejected"] += 1
+                return "503 Service Unavailable", {"error": "busy, try again shortly"}
+
+        if method == "POST" and path == "/end":
+            return "200 OK", {"stats": await self.end(user_id)}
+
+        return "404 Not Found", {"error": f"no route for {method} {path}"}
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:  # keep-alive, one request after another
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, value = line.decode("latin-1").split(":", 1)
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                try:
+                    status, payload = await self._route(method, path, body)
+                except Exception as e:
+                    print(f"[SessionServer] UNEXPECTED ERROR: {e}")
+                    status, payload = "500 Internal Server Error", {"error": type(e).__name__}
+
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8765, unix_path: Optional[str] = None):
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        tasks.append(asyncio.create_task(self.autonomous.live()))
+
+        if unix_path:
+            server = await asyncio.start_unix_server(self._handle, path=unix_path)
+        else:
+            server = await asyncio.start_server(self._handle, host, port)
+        print(f"Codex is listening on {unix_path or f'http://{host}:{port}'}")
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+            for user_id in list(self.sessions):
+                self._end(user_id)
+            self.core.flush()
+            await self.http.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve Codex to many users from one process")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="listen on a Unix socket instead of TCP")
+    parser.add_argument("--max-sessions", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--model-slots", type=int, default=2, help="turns generating at once")
+    args = parser.parse_args()
+
+    server = SessionServer(max_sessions=args.max_sessions, workers=args.workers, model_slots=args.model_slots)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        print("\nBye")
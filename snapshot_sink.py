@@ -0,0 +1,68 @@
+# snapshot_sink.py
+
+import hashlib
+import threading
+import time
+from typing import Callable, Optional
+
+
+class SnapshotSink:
+    """
+    Debug dump of the latest prompt, written off the chat path.
+
+    Disabled unless `enabled=True`. `submit()` only hashes the text and
+    hands it to a background thread, which writes at most once every
+    `min_interval` seconds, always the newest text, and skips text that
+    is identical to what was written last.
+    """
+
+    def __init__(self, write: Callable[[str], None], min_interval: float = 30.0, enabled: bool = False):
+        self.write = write
+        self.min_interval = min_interval
+        self.enabled = enabled
+
+        self._pending: Optional[str] = None
+        self._pending_hash = None
+        self._written_hash = None
+        self._last_write = 0.0
+        self._wake = threading.Condition()
+        self._thread = None
+        self.stats = {"submitted": 0, "deduplicated": 0, "written": 0}
+
+    def submit(self, text: str):
+        if not self.enabled:
+            return
+        digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        with self._wake:
+            self.stats["submitted"] += 1
+            if digest == self._written_hash or digest == self._pending_hash:
+                self.stats["deduplicated"] += 1
+                return
+            self._pending = text
+            self._pending_hash = digest
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="snapshot-sink", daemon=True)
+                self._thread.start()
+            self._wake.notify()
+
+    def _run(self):
+        while True:
+            with self._wake:
+                while self._pending is None:
+                    self._wake.wait()
+                wait = self._last_write + self.min_interval - time.monotonic()
+                if wait > 0:
+                    # newer submissions replace the pending text meanwhile
+                    self._wake.wait(wait)
+                    continue
+                text, digest = self._pending, self._pending_hash
+                self._pending = self._pending_hash = None
+                self._last_write = time.monotonic()
+
+            try:
+                self.write(text)
+                with self._wake:
+                    self._written_hash = digest
+                    self.stats["written"] += 1
+            except Exception as e:
+                print(f"[SnapshotSink] PROBLEM WHEN WRITING SNAPSHOT: {e}")
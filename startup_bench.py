@@ -0,0 +1,110 @@
+# startup_bench.py -- how long until Codex can take the first message
+#
+#   python startup_bench.py            import profile + cold start, 5 runs each
+#   python startup_bench.py --runs 10
+#
+# Every run is a fresh interpreter in a scratch directory (a copy of persona/),
+# so nothing is warm and the real codex/brain files are never touched.
+# Ollama is not contacted, this measures Codex's own start-up only.
+# Exits with 1 when a budget is blown or a heavy module is imported.
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import List, Tuple
+
+ROOT = Path(__file__).resolve().parent
+
+# Measured on a 1 vCPU Intel Xeon VM with Python 3.11.7: medians of
+# 185-265 ms for the import and 200-290 ms to ready over several runs,
+# most of the import being requests (~90 ms) and asyncio (~55 ms).
+# Budgets are the slowest median plus about a third, so only a real
+# regression trips them. Faster machines should re-measure and tighten.
+IMPORT_BUDGET_MS = 350      # import Xsospc_RUN
+COLD_START_BUDGET_MS = 400  # import + Codex(user_id=...)
+HEAVY_MODULES = ("torch", "numpy", "matplotlib")
+
+COLD_START = """
+import sys, time
+start = time.perf_counter()
+from Xsospc_RUN import Codex
+imported = time.perf_counter()
+Codex(user_id="startup_bench", check_health=False)
+ready = time.perf_counter()
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print((imported - start) * 1000, (ready - start) * 1000, ",".join(heavy))
+"""
+
+
+def _run(code: str, cwd: Path, *flags: str) -> subprocess.CompletedProcess:
+    env = {**os.environ, "PYTHONPATH": str(ROOT)}
+    return subprocess.run([sys.executable, *flags, "-c", code], cwd=cwd, env=env,
+                          capture_output=True, text=True, check=True)
+
+
+def import_profile(cwd: Path, module: str = "Xsospc_RUN", top: int = 10) -> Tuple[float, List[Tuple[float, str]]]:
+    """Total import time of `module` in ms and its slowest imports (cumulative ms, name)"""
+    stderr = _run(f"import {module}", cwd, "-X", "importtime").stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative) / 1000, name.rstrip()))
+    # children are printed before their parent, one indent level deeper
+    end = next(i for i in range(len(rows) - 1, -1, -1) if rows[i][1].strip() == module)
+    total, name = rows[end]
+    depth = len(name) - len(name.lstrip())
+    direct = []
+    for ms, name in reversed(rows[:end]):
+        indent = len(name) - len(name.lstrip())
+        if indent <= depth:
+            break
+        if indent == depth + 2:
+            direct.append((ms, name.strip()))
+    return total, sorted(direct, reverse=True)[:top]
+
+
+def cold_start(cwd: Path) -> Tuple[float, float, List[str]]:
+    """(import ms, ready ms, heavy modules loaded) for one fresh interpreter"""
+    imported, ready, heavy = _run(COLD_START.format(heavy=HEAVY_MODULES), cwd).stdout.split(" ")
+    return float(imported), float(ready), [name for name in heavy.strip().split(",") if name]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Codex start-up benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        cwd = Path(scratch)
+        shutil.copytree(ROOT / "persona", cwd / "persona")
+
+        total, slowest = import_profile(cwd)
+        print(f"import Xsospc_RUN (-X importtime): {total:7.1f} ms")
+        for ms, name in slowest:
+            print(f"    {ms:7.1f} ms  {name}")
+
+        runs = [cold_start(cwd) for _ in range(args.runs)]
+
+    import_ms = statistics.median(run[0] for run in runs)
+    ready_ms = statistics.median(run[1] for run in runs)
+    heavy = sorted({name for run in runs for name in run[2]})
+
+    print(f"cold start, median of {args.runs}:")
+    print(f"    import            {import_ms:7.1f} ms  (budget {IMPORT_BUDGET_MS} ms)")
+    print(f"    Codex(user_id=..) {ready_ms:7.1f} ms  (budget {COLD_START_BUDGET_MS} ms)")
+    print(f"    heavy modules     {', '.join(heavy) or 'none'}")
+
+    if import_ms > IMPORT_BUDGET_MS or ready_ms > COLD_START_BUDGET_MS or heavy:
+        print("OVER BUDGET")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# thought_log.py
+
+import atexit
+import json
+from collections import deque
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+
+_shared: Dict[str, "ThoughtLog"] = {}
+
+
+class ThoughtLog:
+    """
+    Codex's thoughts as an append-only JSONL file.
+
+    A thought costs one appended line, however long Codex has been
+    running. Once the file passes `max_bytes` it is rotated to `.1`,
+    `.1` to `.2` and so on, and anything past `backups` is deleted, so
+    disk use is bounded too. The newest `keep` thoughts stay in memory
+    (`recent`); `page()` reads further back from disk only when asked.
+    """
+
+    def __init__(self, path, max_bytes: int = 1 << 20, backups: int = 3, keep: int = 200):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.recent = deque(maxlen=keep)
+        self.stats = {"appends": 0, "rotations": 0}
+
+        self._file = None
+        self._size = self.path.stat().st_size if self.path.exists() else 0
+        self.recent.extend(reversed(list(islice(self._newest_first(), keep))))
+        atexit.register(self.close)
+
+    def _files(self) -> List[Path]:
+        """Newest file first"""
+        return [self.path] + [self.path.with_name(f"{self.path.name}.{i}") for i in range(1, self.backups + 1)]
+
+    def _newest_first(self) -> Iterator[Dict]:
+        self.flush()
+        for path in self._files():
+            if not path.exists():
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+            for line in reversed(lines):
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue  # torn line from a crash mid-write
+
+    def append(self, entry: Dict):
+        line = json.dumps(entry) + "\n"
+        if self._size and self._size + len(line) > self.max_bytes:
+            self._rotate()
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(line)
+        self._size += len(line)
+        self.recent.append(entry)
+        self.stats["appends"] += 1
+
+    def _rotate(self):
+        self.close()
+        files = self._files()
+        if self.backups:
+            files[-1].unlink(missing_ok=True)
+            for newer, older in zip(reversed(files[:-1]), reversed(files[1:])):
+                if newer.exists():
+                    newer.replace(older)
+        else:
+            self.path.unlink(missing_ok=True)
+        self._size = 0
+        self.stats["rotations"] += 1
+
+    def page(self, page: int = 0, page_size: int = 10) -> List[Dict]:
+        """
+        Thoughts, newest page first (page 0 is the most recent).
+        Each page is oldest first, ready to put in a prompt.
+        """
+        start, end = page * page_size, (page + 1) * page_size
+        if end <= len(self.recent):
+            newest = list(islice(reversed(self.recent), start, end))
+        else:
+            newest = list(islice(self._newest_first(), start, end))
+        return newest[::-1]
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def get_thought_log(path, **kwargs) -> ThoughtLog:
+    """One log per file, shared by every loop of the same Codex"""
+    key = str(path)
+    if key not in _shared:
+        _shared[key] = ThoughtLog(path, **kwargs)
+    return _shared[key]
@@ -0,0 +1,125 @@
+# transcript_store.py
+
+import atexit
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+_shared: Dict[str, "TranscriptStore"] = {}
+
+
+class TranscriptStore:
+    """
+    Every conversation turn, kept on disk in SQLite.
+
+    Rows are indexed by (user_id, date) and (user_id, session_id), reads
+    are paged, so only the turns that are asked for are ever in memory.
+    Appends are batched into one transaction until `commit()`.
+    """
+
+    def __init__(self, path="codex/brain/Codex_transcripts.db"):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS turns (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    session_id TEXT NOT NULL,
+                    role TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    metadata TEXT
+                );
+                CREATE INDEX IF NOT EXISTS turns_by_time ON turns (user_id, date);
+                CREATE INDEX IF NOT EXISTS turns_by_session ON turns (user_id, session_id, id);
+            """)
+            self._conn.commit()
+        atexit.register(self.close)
+
+    def append(self, user_id: str, session_id: str, turn: Dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO turns (user_id, session_id, role, response, date, metadata) VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, session_id, turn["role"], turn["response"], turn["date"],
+                 json.dumps(turn.get("metadata") or {}))
+            )
+
+    def commit(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.commit()
+
+    def page(self, user_id: str, page: int = 0, page_size: int = 20,
+             session_id: Optional[str] = None, skip: int = 0) -> List[Dict]:
+        """
+        Turns of a user, newest page first (page 0 is the most recent).
+        `skip` leaves out that many of the newest turns, e.g. the ones
+        still held in the conversation buffer. Each page is oldest first.
+        """
+        query = "SELECT role, response, date, metadata, session_id FROM turns WHERE user_id = ?"
+        params = [user_id]
+        if session_id is not None:
+            query += " AND session_id = ?"
+            params.append(session_id)
+        query += " ORDER BY id DESC LIMIT ? OFFSET ?"
+        params += [page_size, skip + page * page_size]
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [self._to_turn(row) for row in reversed(rows)]
+
+    def between(self, user_id: str, start: str, end: str, limit: int = 100) -> List[Dict]:
+        """Turns with start <= date < end (ISO strings), oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT role, response, date, metadata, session_id FROM turns "
+                "WHERE user_id = ? AND date >= ? AND date < ? ORDER BY date LIMIT ?",
+                (user_id, start, end, limit)
+            ).fetchall()
+        return [self._to_turn(row) for row in rows]
+
+    def sessions(self, user_id: str) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT session_id FROM turns WHERE user_id = ? GROUP BY session_id ORDER BY MIN(id)",
+                (user_id,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def count(self, user_id: str) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM turns WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.commit()
+                self._conn.close()
+                self._conn = None
+
+    @staticmethod
+    def _to_turn(row) -> Dict:
+        role, response, date, metadata, session_id = row
+        return {
+            "role": role,
+            "response": response,
+            "date": date,
+            "metadata": json.loads(metadata) if metadata else {},
+            "session_id": session_id
+        }
+
+
+def get_store(path) -> TranscriptStore:
+    """One connection per database file, shared by every user"""
+    key = str(path)
+    if key not in _shared:
+        _shared[key] = TranscriptStore(path)
+    return _shared[key]
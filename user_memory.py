@@ -3,26 +3,48 @@
 
 from datetime import date, datetime
 from pathlib import Path
+import atexit
 import re
 import asyncio
 import json
 from agent_core import AgentCore
+from journal import JournaledFile, atomic_write_json
+from fact_extraction import get_extractor
+from conversation_buffer import ConversationBuffer, GzipTranscript
+from transcript_store import get_store
+from memory_search import FactIndex
+from context_budget import ContextBuilder
+from itertools import islice
 import uuid
 from typing import List, Dict, Optional
 
 
 class selfaware:
-    def __init__(self, agent_core, user_id: str, date: date = date.today()):
+    def __init__(self, agent_core, user_id: str, date: date = date.today(),
+                 spill_transcript: bool = False, keep_transcript: bool = True,
+                 context_window: int = 8192, history_tokens: int = 2048):
         self.user_database_id = str(uuid.uuid4())
         self.booting_info = agent_core
         self.path = self.booting_info.get_storage_path()
         self._name_ = self.booting_info.get_name()
         self.date = date
 
-        self.buffer: List[Dict] = []
         self.user_id = user_id
         self.max_speech = 100
+        self.transcript = None
+        if spill_transcript:
+            # turns pushed out of the buffer are kept compressed on disk
+            self.transcript = GzipTranscript(self.path / f"{self._name_}_{self.user_id}_transcript.jsonl.gz")
+        # what part of the buffer goes into the prompt, see ContextBuilder
+        self.context_builder = ContextBuilder(window=context_window, history_tokens=history_tokens)
+        self.buffer = ConversationBuffer(self.max_speech, spill=self._spill)
+        # every turn also goes to SQLite, older turns are read back by page
+        self.session_id = str(uuid.uuid4())
+        self.transcripts = get_store(self.path / f"{self._name_}_transcripts.db") if keep_transcript else None
         self.information = []
+        self.extractor = get_extractor()
+        self.fact_index = FactIndex()
+        self.vector_index = None  # built by MemorySearch on first vector query
 
         self.current_info = {
             "id": self.user_database_id,
@@ -35,7 +57,14 @@ class selfaware:
             "last_interaction": None, 
             "topics_mentioned": []
         }
+        self.journal = JournaledFile(self.path / f"{self._name_}_{self.user_id}.json")
+        # current_info is the source of truth, the file only catches up
+        # once per turn (see end_turn)
+        self._unsaved = False
+        self._turn_start = dict(self.journal.stats)
+        self.last_turn_io = {"fsyncs": 0, "parses": 0}
         self.load_user_data()
+        atexit.register(self.flush_user_data)
 
 
 
@@ -49,11 +78,12 @@ class selfaware:
     def load_user_data(self):
         """Load user data"""
         path = self.path / f"{self._name_}_{self.user_id}.json"
-        if path.exists():
-            with open(path, 'r') as f:
-                self.current_info = json.load(f)
+        if self.journal.exists():
+            self.current_info = self.journal.load(default=self.current_info)
         else:
             self.create_user_file(path)
+        self.fact_index.rebuild(self.current_info["facts"])
+        self.vector_index = None
 
 
     def create_user_file(self, path):
@@ -64,26 +94,46 @@ class selfaware:
         :param path: Path, example: "codex/brain/example.json
         """
         path = Path(path)
-        try:
-            with open(path, 'w') as f:
-                json.dump(self.current_info, f, indent=2)
-        except Exception as e:
-            print(f"There was an error when creating user data, DETAILS: {e}")
+        if not atomic_write_json(path, self.current_info):
+            print(f"There was an error when creating user data, DETAILS: {path}")
             
 
     def save_user_data(self):
-        """Save user data"""
-        path = self.path / f"{self._name_}_{self.user_id}.json"
-        with open(Path(path), 'w') as f:
-            json.dump(self.current_info, f, indent=2)
-            self.assign_new_json()
+        """Mark user data as changed, it gets written once at the end of the turn"""
+        self._unsaved = True
+
+
+    def flush_user_data(self):
+        """Write user data now if anything changed"""
+        if not self._unsaved:
+            return
+        if self.journal.save(self.current_info):
+            self._unsaved = False
+
+
+    def begin_turn(self):
+        self._turn_start = dict(self.journal.stats)
+
+
+    def end_turn(self) -> Dict:
+        """Flush the turn's changes and report the file I/O it cost"""
+        self.flush_user_data()
+        if self.transcripts:
+            self.transcripts.commit()
+        self.last_turn_io = {
+            key: self.journal.stats[key] - self._turn_start.get(key, 0)
+            for key in ("fsyncs", "parses")
+        }
+        self._turn_start = dict(self.journal.stats)
+        return self.last_turn_io
 
 
     def assign_new_json(self):
-        path = self.path / f"{self._name_}_{self.user_id}.json"
+        """Reload user data from disk, dropping unsaved changes"""
         try:
-            with open(path, 'r') as f:
-                self.current_info = json.load(f)
+            self.current_info = self.journal.load(default=self.current_info)
+            self.fact_index.rebuild(self.current_info["facts"])
+            self.vector_index = None
         except Exception as e: 
             print(f"[assign_new_json] => There was an error when creating json file: {e}")
 
@@ -98,12 +148,10 @@ class selfaware:
             "metadata": metadata or {}
         }
 
-        if len(self.buffer) > self.max_speech:
-            self.buffer.pop(0)
-        
         if role.lower() == "user":
+            self.begin_turn()
             self._learn_about_the_person(response)
-            self.booting_info.set_mood(response)
+            self.booting_info.feel(response)
 
             
 
@@ -112,228 +160,92 @@ class selfaware:
             self.booting_info.introspec()
 
         self.buffer.append(info)
+        self._save_conversations(info)
 
     
         
 
     def _learn_about_the_person(self, response: str):
-        response = response.lower()
-        facts_pattern = [
-            # Explicit preferences
-            r"I enjoy (\w+)",
-            r"I like (\w+)",
-            r"I love (\w+)",
-            
-            # Activity mentions
-            r"I (?:was|am) playing (\w+)",
-            r"I play (\w+)",
-            r"I (?:was|am) (?:doing|watching) (\w+)",
-            
-            # Interests
-            r"I'm interested in (\w+)",
-            r"I'm into (\w+)",
-            
-            # Ownership/experience
-            r"I have (?:a|an) (\w+)",
-            r"I own (?:a|an) (\w+)"
-        ]
-        for pattern in facts_pattern:
-            match = re.search(pattern, response)
-            if match:
-                fact = match.group(1)
-                if fact not in self.current_info["facts"]:
-                    self.current_info["facts"][fact] = {
-
-                        "python": {
-                            "mood": "Liked",
-                            "sentiment": 0.9,
-                            "confidence": 0.7,
-                            "last_mentioned": str(datetime.utcnow().isoformat())
-                        }
-                    }
+        facts = self.current_info["facts"]
+        known = len(facts)
+        for fact in self.extractor.extract(response):
+            kind, value = fact.kind, fact.value
 
-    
-        disliked_facts_pattern =[
-            r"I don't enjoy doing (\w+)",
-            r"I don't like (\w+)",
-            r"I'm not interested in (\w+)"
-        ]
-
-        for pattern in disliked_facts_pattern:
-            match = re.search(pattern, response)
-            if match:
-                disliked_fact = match.group(1)
-                if disliked_fact not in self.current_info["facts"]:
-                    self.current_info["facts"][disliked_fact] = {
+            if kind in ("liked", "disliked", "hated"):
+                if value not in facts:
+                    facts[value] = {
 
                         "python": {
-                            "mood": "Disliked",
+                            "mood": kind.capitalize(),
                             "sentiment": 0.9,
                             "confidence": 0.7,
                             "last_mentioned": str(datetime.utcnow().isoformat())
                         }
                     }
 
-        hated_facts_pattern =[
-            r"I hate doing (\w+)",
-            r"I can't stand (\w+)",
-        ]
-        for pattern in hated_facts_pattern:
-            match = re.search(pattern, response)
-            if match:
-                fact = match.group(1)
-                if fact not in self.current_info["facts"]:
-                    self.current_info["facts"][fact] = {
-
-                        "python": {
-                            "mood": "Hated",
-                            "sentiment": 0.9,
-                            "confidence": 0.7,
-                            "last_mentioned": str(datetime.utcnow().isoformat())
-                        }
-                    }
-                    self.save_user_data()
-
-        favorite_patterns = [
-            (r"I love (\w+)", 1),
-            (r"I absolutely (?:love|like) (\w+)", 1)
-        ]
-
-        for pattern, group_num in favorite_patterns:
-            match = re.search(pattern, response.lower())
-            if match and match not in self.current_info["facts"]:
-                fact = match.group(group_num)
-                if fact not in self.current_info["facts"]:
-                    self.current_info["facts"][fact] = {
+            elif kind == "loved":
+                if value not in facts:
+                    facts[value] = {
                             "mood": "Loved",
                             "sentiment": 0.9,
                             "confidence": 0.7,
                             "last_mentioned": datetime.utcnow().isoformat()
                         }
-                    self.save_user_data()
 
+            elif kind == "nickname":
+                if not self.current_info["nickname"]:
+                    self.current_info["nickname"] = value
 
-        nickname_pattern = [
-            r"People (sometimes|also) call me (\w+)",
-            r"I rather be called (\w+)",
-        ]
-        for pattern in nickname_pattern:
-            match = re.search(pattern, response)
+            elif kind == "name":
+                self.current_info["name"] = value.capitalize()
+                self.reconize_user(self.current_info["name"])
 
-            if match and not self.current_info["nickname"]:
-                self.current_info["nickname"] = match.group(1)
+            elif kind == "feeling":
+                # TODO: change the mood of the bot
+                self.booting_info.set_mood(value)
 
-            
+            elif kind == "preference":
+                self.current_info["preferences"][value] = "positive"
 
-        identity_pattern = [
-    r"(?:^|\s)I am (\w+)",  # Must start sentence or after space
-    r"(?:^|\s)[Mm]y [Nn]ame (?:is|was) (\w+)",
-    r"(?:^|\s)(?:You can )?[Cc]all me (\w+)",
-    r"(?:^|\s)I'm (\w+)",  # Add this too
-]
-
-        for pattern in identity_pattern: 
-            match = re.search(pattern, response)
-            if match:
-                potential_name = match.group(1).capitalize()
-                if potential_name not in ["my", "your", "the", "a", "and"]:
-                    self.current_info["name"] = potential_name
-                    self.reconize_user(self.current_info["name"])
-
-        feelings_pattern = [
-            r"I love you",
-            r"(You are|You're) my everything",
-            r"I miss you"
-        ]
-
-        for pattern in feelings_pattern:
-            match = re.search(pattern, response)
-            if match:
-                # TODO: change the mood of the bot
-                self.booting_info.set_mood(match.group(0))
-
-        prefer_patterns = [
-            r"I prefer (\w+)",
-            r"I prefer this (\w+)",
-            r"I have a preference for (\w+)",
-            r"I preferably want (\w+)",
-            r"preferably (\w+)",
-            r"I rather (have|get) (\w+)"
-        ]
-        for pattern in prefer_patterns:
-            match = re.search(pattern, response)
-            if match:
-                prefers = match.group(1)
-                self.current_info["preferences"][prefers] = "positive"
-                self.save_user_data()
-
-
-        activity_patterns = [
-        (r"I (?:was|am|been) playing (\w+(?:\s+\w+)*)", "activity", "Liked"),
-        (r"I play (\w+(?:\s+\w+)*)", "activity", "Liked"),
-        (r"I watch (\w+(?:\s+\w+)*)", "activity", "Liked"),
-        (r"I listen to (\w+(?:\s+\w+)*)", "activity", "Liked"),
-    ]
-    
-        for pattern, category, default_mood in activity_patterns:
-            matches = re.findall(pattern, response)
-            for match in matches:
-                fact_name = match.strip()
-            
-                if fact_name not in self.current_info["facts"]:
-                    self.current_info["facts"][fact_name] = {
-                        "category": category,
-                        "mood": default_mood,
+            elif kind == "activity":
+                if value not in facts:
+                    facts[value] = {
+                        "category": "activity",
+                        "mood": "Liked",
                         "sentiment": 0.7,
                         "confidence": 0.6,
                         "first_mentioned": datetime.utcnow().isoformat(),
                         "mention_count": 1
                     }
-                    self.save_user_data()
-                else:
+                elif "mention_count" in facts[value]:
                     # Reinforce existing fact
-                    self.current_info["facts"][fact_name]["mention_count"] += 1
-                    self.current_info["facts"][fact_name]["confidence"] = min(
-                        1.0,
-                        self.current_info["facts"][fact_name]["confidence"] + 0.1
-                    )
-                    self.save_user_data()
-        number_preference_pattern = [
-    r"[Mm]y favorite number is (\d+)",
-    r"[Mm]y favorite is (\d+)",
-        ]
-
-        for pattern in number_preference_pattern:
-            match = re.search(pattern, response)
-            if match:
-                number = int(match.group(1))
+                    facts[value]["mention_count"] += 1
+                    facts[value]["confidence"] = min(1.0, facts[value]["confidence"] + 0.1)
+
+            elif kind == "favorite_number":
+                number = int(value)
                 self.current_info["preferences"]["favorite_number"] = number
-                
+
                 # Also learn it as a fact
-                self.current_info["facts"][f"favorite_number_{number}"] = {
+                facts[f"favorite_number_{number}"] = {
                     "mood": "Loved",
                     "sentiment": 1.0,
                     "confidence": 0.9,
                     "first_mentioned": datetime.utcnow().isoformat()
-        }
-        game_patterns = [
-    r"I (?:love|like|enjoy|play) (?:games like )?(\w+)",
-    r"(\w+) or (\w+)",  # "pac man or subway surfers"
-]
-
-        for pattern in game_patterns:
-            matches = re.findall(pattern, response.lower())
-            for match in matches:
-                game = match if isinstance(match, str) else match[0]
-            
-                if game not in ["i", "you", "my", "your", "the"]:
-                    if game not in self.current_info["facts"]:
-                        self.current_info["facts"][game] = {
+                }
+
+            elif kind == "game":
+                if value not in facts:
+                    facts[value] = {
                         "category": "game",
                         "mood": "Liked",
                         "confidence": 0.7,
                         "first_mentioned": datetime.utcnow().isoformat()
                     }
+
+        # facts are only ever added here, so the new ones sit at the end
+        for fact_name in islice(facts, known, None):
+            self.fact_index.add(fact_name)
         self.save_user_data()
 
     def reconize_user(self, user):
@@ -373,8 +285,9 @@ class selfaware:
 
 
         main_path = path / f"{self.user_id}.json"
-        with open(main_path, 'w') as f:
-            json.dump(self.current_info, f,indent=2)
+        atomic_write_json(main_path, self.current_info)
+        self.save_user_data()
+        self.flush_user_data()
     
     def get_summary_stats(self) -> Dict:
         return {
@@ -384,11 +297,14 @@ class selfaware:
             "last_seen": self.current_info.get("last_interaction", "Never")
             }
 
-    def get_relevant_context(self) -> Dict:
-
-
+    def get_relevant_context(self, older_turns: int = 0) -> Dict:
+        """
+        :param older_turns: also pull this many turns from before the
+                            buffer out of the transcript store
+        """
         context = {
-            "conversation_history": self.buffer[-50:],
+            # the whole buffer, ContextBuilder decides what fits the prompt
+            "conversation_history": self.buffer.window(self.max_speech),
             "user_info": {
                 "name": self.current_info.get("name"),
                 "known_facts": self.current_info.get("facts"), #[:5],  # Top 5 facts
@@ -401,16 +317,46 @@ class selfaware:
                 "topics_discussed": self.current_info.get("topics_discussed", [])[-3:]
             }
         }
+        if older_turns:
+            context["older_history"] = self.get_older_turns(page_size=older_turns)
         
         return context
 
+    def _spill(self, turn: Dict):
+        """A turn pushed out of the buffer: into the rolling note, and to disk if asked"""
+        self.context_builder.fold([turn])
+        if self.transcript:
+            self.transcript(turn)
+
     def _clear_short_term_memory(self):
-        self.buffer = []
+        self.buffer.clear()
+        self.context_builder.reset()
         self.booting_info.set_mood("average day")
     
-    def _save_conversations(self, role: str):
-        # TODO: fix this
-        pass
+    def _save_conversations(self, turn: Dict):
+        """Append a turn to the transcript store (committed in end_turn)"""
+        if self.transcripts:
+            self.transcripts.append(self.user_id, self.session_id, turn)
+
+    def get_older_turns(self, page: int = 0, page_size: int = 20) -> List[Dict]:
+        """Turns that already left the buffer, newest page first"""
+        if not self.transcripts:
+            return []
+        return self.transcripts.page(self.user_id, page, page_size, skip=len(self.buffer))
+
+    def close(self):
+        """Flush everything and let go of this user, e.g. when a server evicts it"""
+        self.flush_user_data()
+        atexit.unregister(self.flush_user_data)
+        if self.transcripts:
+            self.transcripts.commit()
+        if self.transcript:
+            self.transcript.close()
+            atexit.unregister(self.transcript.close)
+
+    def get_io_stats(self) -> Dict:
+        """fsyncs/parses of the user file during the last turn"""
+        return self.last_turn_io
 
     def get_user(self):
         return self.user_id
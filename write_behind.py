@@ -0,0 +1,124 @@
+# write_behind.py
+
+import atexit
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional
+from journal import JournaledFile
+
+
+class WriteBehindStore:
+    """
+    Keeps brain files in memory and writes them back lazily.
+
+    Callers mark a file dirty after mutating it. All marks made during a
+    turn collapse into a single write, which happens when the oldest
+    unsaved change is older than `max_delay` seconds, when more than
+    `max_pending` changes piled up, or when someone calls `flush()`
+    (end of session, interpreter exit). Each write is a journal append,
+    see journal.py. A timer started by the first unsaved change enforces
+    `max_delay` even when no turn follows to call `maybe_flush()`.
+
+    Pass the owner's `lock` so that building the snapshot and writing it
+    happen while nobody can mutate the object being saved.
+    """
+
+    def __init__(self, max_delay: float = 5.0, max_pending: int = 64, lock=None):
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+
+        self._targets: Dict[str, tuple] = {}  # name -> (JournaledFile, getter)
+        self._dirty = set()
+        self._pending = 0
+        self._dirty_since: Optional[float] = None
+        self._lock = lock or threading.RLock()
+
+        self.stats = {
+            "marked": 0,
+            "flushes": 0,
+            "writes": 0
+        }
+        atexit.register(self.flush)
+
+    def register(self, name: str, path, getter: Callable):
+        """Track a JSON file, `getter` returns the object to dump"""
+        with self._lock:
+            self._targets[name] = (JournaledFile(path), getter)
+
+    def load(self, name: str, default=None):
+        """Recover a registered file (snapshot + journal replay)"""
+        with self._lock:
+            journal, _ = self._targets[name]
+            return journal.load(default)
+
+    def exists(self, name: str) -> bool:
+        return self._targets[name][0].exists()
+
+    def mark_dirty(self, name: str):
+        with self._lock:
+            if name not in self._targets:
+                return
+            if self._dirty_since is None:
+                self._dirty_since = time.monotonic()
+                self._start_timer()
+            self._dirty.add(name)
+            self._pending += 1
+            self.stats["marked"] += 1
+            if self._pending >= self.max_pending:
+                self.flush()
+
+    def _start_timer(self, delay: Optional[float] = None):
+        # a daemon thread, so an idle Codex still writes within max_delay
+        timer = threading.Timer(self.max_delay if delay is None else delay,
+                                self._on_timer, args=(self._dirty_since,))
+        timer.daemon = True
+        timer.start()
+
+    def _on_timer(self, dirty_since: float):
+        with self._lock:
+            if self._dirty_since != dirty_since:
+                return  # already written, a newer change has its own timer
+            left = self.max_delay - (time.monotonic() - dirty_since)
+            if left > 0 and self._pending < self.max_pending:
+                self._start_timer(left)
+                return
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[WriteBehindStore] timed flush failed: {e}")
+
+    def is_dirty(self) -> bool:
+        return bool(self._dirty)
+
+    def is_due(self) -> bool:
+        if not self._dirty:
+            return False
+        if self._pending >= self.max_pending:
+            return True
+        return time.monotonic() - self._dirty_since >= self.max_delay
+
+    def maybe_flush(self) -> bool:
+        """Flush only if the time/size budget ran out"""
+        with self._lock:
+            if not self.is_due():
+                return False
+            self.flush()
+            return True
+
+    def flush(self, names: Optional[Iterable[str]] = None):
+        """Write every dirty file (or only `names`) to disk"""
+        with self._lock:
+            todo = self._dirty if names is None else self._dirty & set(names)
+            if not todo:
+                return
+
+            for name in list(todo):
+                journal, getter = self._targets[name]
+                if journal.save(getter()):
+                    self.stats["writes"] += 1
+                self._dirty.discard(name)
+
+            self.stats["flushes"] += 1
+            if not self._dirty:
+                self._pending = 0
+                self._dirty_since = None